@@ -1,16 +1,18 @@
 from dataclasses import dataclass
 
 from .agent import Agent
-from .interpreter import Interpreter
 from .journal import Journal
-from omegaconf import OmegaConf
+from .parallel import ParallelRunner
 from rich.status import Status
 from .utils.config import (
+    create_interpreters,
     load_task_desc,
     prep_agent_workspace,
+    prep_worker_workspaces,
     save_run,
     _load_cfg,
     prep_cfg,
+    setup_llm_cache,
 )
 
 
@@ -35,11 +37,13 @@ class Experiment:
         _cfg.goal = goal
         _cfg.eval = eval
         self.cfg = prep_cfg(_cfg)
+        setup_llm_cache(self.cfg)
 
         self.task_desc = load_task_desc(self.cfg)
 
         with Status("Preparing agent workspace (copying and extracting files) ..."):
             prep_agent_workspace(self.cfg)
+            worker_dirs = prep_worker_workspaces(self.cfg)
 
         self.journal = Journal()
         self.agent = Agent(
@@ -47,16 +51,41 @@ class Experiment:
             cfg=self.cfg,
             journal=self.journal,
         )
-        self.interpreter = Interpreter(
-            self.cfg.workspace_dir,
-            **OmegaConf.to_container(self.cfg.exec),  # type: ignore
-        )
+        self.interpreters = create_interpreters(self.cfg, worker_dirs)
+        self.interpreter = self.interpreters[0]
+
+    def run(self, steps: int, finalize: bool = True) -> Solution:
+        """
+        Run `steps` steps of the experiment, returns the best solution so far.
 
-    def run(self, steps: int) -> Solution:
-        for _i in range(steps):
-            self.agent.step(exec_callback=self.interpreter.run)
-            save_run(self.cfg, self.journal)
-        self.interpreter.cleanup_session()
+        Args:
+            steps (int): number of steps to run
+            finalize (bool, optional): Whether to finalize the experiment afterwards (see `finalize`). Callers that run it
+                in several calls (e.g. one step at a time) should finalize it only once, after the last call. Defaults to True.
+        """
+        try:
+            if len(self.interpreters) > 1 or self.cfg.agent.pipeline_lookahead > 0:
+                runner = ParallelRunner(
+                    self.agent,
+                    self.interpreters,
+                    lookahead=self.cfg.agent.pipeline_lookahead,
+                    on_step=lambda: save_run(self.cfg, self.journal),
+                )
+                runner.run(steps)
+            else:
+                for _i in range(steps):
+                    self.agent.step(exec_callback=self.interpreter.run)
+                    save_run(self.cfg, self.journal)
+        finally:
+            # also on errors and Ctrl+C, so that the journal of the run is kept
+            if finalize:
+                self.finalize()
 
         best_node = self.journal.get_best_node(only_good=False)
         return Solution(code=best_node.code, valid_metric=best_node.metric.value)
+
+    def finalize(self) -> None:
+        """Stop the interpreters and write the final logs (the complete journal and the tree visualization)."""
+        for interpreter in self.interpreters:
+            interpreter.cleanup_session()
+        save_run(self.cfg, self.journal, final=True)
@@ -1,10 +1,11 @@
 import logging
 import random
+import shutil
 from typing import Any, Callable, cast
 
 import humanize
 from .backend import FunctionSpec, query
-from .interpreter import ExecutionResult
+from .interpreter import SNAPSHOT_MARKER, ExecutionResult, partition_cpus
 from .journal import Journal, Node
 from .utils import data_preview
 from .utils.config import Config
@@ -14,7 +15,10 @@ from .utils.response import extract_code, extract_text_up_to_code, wrap_code
 logger = logging.getLogger("aide")
 
 
-ExecCallbackType = Callable[[str, bool], ExecutionResult]
+ExecCallbackType = Callable[[str, bool, str | None, str | None], ExecutionResult]
+
+# profiles of shorter executions aren't shown to the agent
+MIN_PROFILE_SECONDS = 5.0
 
 review_func_spec = FunctionSpec(
     name="submit_review",
@@ -57,13 +61,17 @@ class Agent:
         self.acfg = cfg.agent
         self.journal = journal
         self.data_preview: str | None = None
+        # bookkeeping for nodes that are currently being worked on by (parallel) steps
+        self._pending_drafts = 0
+        self._busy_nodes: set[str] = set()
 
     def search_policy(self) -> Node | None:
         """Select a node to work on (or None to draft a new node)."""
         search_cfg = self.acfg.search
 
         # initial drafting
-        if len(self.journal.draft_nodes) < search_cfg.num_drafts:
+        num_drafts = self.journal.num_drafts + self._pending_drafts
+        if num_drafts < search_cfg.num_drafts:
             logger.debug("[search policy] drafting new node (not enough drafts)")
             return None
 
@@ -73,7 +81,11 @@ class Agent:
             debuggable_nodes = [
                 n
                 for n in self.journal.buggy_nodes
-                if (n.is_leaf and n.debug_depth <= search_cfg.max_debug_depth)
+                if (
+                    n.is_leaf
+                    and n.debug_depth <= search_cfg.max_debug_depth
+                    and n.id not in self._busy_nodes
+                )
             ]
             if debuggable_nodes:
                 logger.debug("[search policy] debugging")
@@ -81,8 +93,7 @@ class Agent:
             logger.debug("[search policy] not debugging by chance")
 
         # back to drafting if no nodes to improve
-        good_nodes = self.journal.good_nodes
-        if not good_nodes:
+        if not self.journal.num_good:
             logger.debug("[search policy] drafting new node (no good nodes)")
             return None
 
@@ -112,6 +123,14 @@ class Agent:
         env_prompt = {
             "Installed Packages": f"Your solution can use any relevant machine learning packages such as: {pkg_str}. Feel free to use any other packages too (all packages are already installed!). For neural networks we suggest using PyTorch rather than TensorFlow."
         }
+        if self.acfg.cpu_partition and self.acfg.parallel_workers > 1:
+            # other workers run on the remaining cores, each worker gets at least this many
+            num_cores = min(len(c) for c in partition_cpus(self.acfg.parallel_workers))
+            env_prompt["Hardware"] = (
+                f"Your code runs on {num_cores} CPU core{'s' if num_cores > 1 else ''} (other code runs in parallel on the remaining cores, "
+                "so `os.cpu_count()` overstates it). Size the parallelism accordingly, "
+                f"e.g. `n_jobs={num_cores}`, `num_workers` of data loaders and thread counts of at most {num_cores}."
+            )
         return env_prompt
 
     @property
@@ -126,6 +145,19 @@ class Agent:
             '**If there is test data provided for this task, please save the test predictions in a `submission.csv` file in the "./working" directory as described in the task description** This is extremely important since this file is used for grading/evaluation. DO NOT FORGET THE submission.csv file!',
             'You can also use the "./working" directory to store any temporary files that your code needs to create.',
         ]
+        if self.cfg.exec.shared_tables:
+            tables = ", ".join(f'"{t}"' for t in self.cfg.exec.shared_tables)
+            impl_guideline.append(
+                f"The input tables {tables} are also available as read-only pandas DataFrames that share their memory with other running solutions "
+                '(string columns are categoricals), e.g. `from aide_data import load_table; train = load_table("train.csv")`. '
+                "Prefer them over reading these files to save memory and loading time, and use `.copy()` before modifying a table in place."
+            )
+        if self.cfg.exec.snapshots:
+            impl_guideline.append(
+                "Put the loading and preprocessing of the data that doesn't depend on the model at the top of the code and end it with a line containing only "
+                f"`{SNAPSHOT_MARKER}`. Code with the same part before this line reuses its results instead of running it again, "
+                "so keep that part unchanged when you improve or fix the rest of the code (unless it has to change)."
+            )
         if self.acfg.expose_prediction:
             impl_guideline.append(
                 "The implementation should include a predict() function, "
@@ -140,6 +172,12 @@ class Agent:
 
         return {"Implementation guideline": impl_guideline}
 
+    def _prompt_profile(self, node: Node) -> dict:
+        """Where the previous execution spent its time (only if it was profiled and ran for a while)."""
+        if node.profile is None or node.profile.duration < MIN_PROFILE_SECONDS:
+            return {}
+        return {"Execution profile": wrap_code(node.profile.describe(), lang="")}
+
     @property
     def _prompt_resp_fmt(self):
         return {
@@ -218,7 +256,7 @@ class Agent:
         }
         prompt["Previous solution"] = {
             "Code": wrap_code(parent_node.code),
-        }
+        } | self._prompt_profile(parent_node)
 
         prompt["Instructions"] |= self._prompt_resp_fmt
         prompt["Instructions"] |= {
@@ -229,16 +267,25 @@ class Agent:
                 "Take the Memory section into consideration when proposing the improvement.",
                 "The solution sketch should be 3-5 sentences.",
                 "Don't suggest to do EDA.",
-            ],
+            ]
+            + (
+                [
+                    "If the previous solution is slow, use the execution profile to target its actual bottlenecks."
+                ]
+                if self.cfg.exec.profile
+                else []
+            ),
         }
         prompt["Instructions"] |= self._prompt_impl_guideline
 
         plan, code = self.plan_and_code_query(prompt)
-        return Node(
-            plan=plan,
-            code=code,
-            parent=parent_node,
-        )
+        # creating a child links it into the parent's children -> don't race with readers of the tree
+        with self.journal.lock:
+            return Node(
+                plan=plan,
+                code=code,
+                parent=parent_node,
+            )
 
     def _debug(self, parent_node: Node) -> Node:
         prompt: Any = {
@@ -251,6 +298,7 @@ class Agent:
             "Task description": self.task_desc,
             "Previous (buggy) implementation": wrap_code(parent_node.code),
             "Execution output": wrap_code(parent_node.term_out, lang=""),
+            **self._prompt_profile(parent_node),
             "Instructions": {},
         }
         prompt["Instructions"] |= self._prompt_resp_fmt
@@ -258,7 +306,14 @@ class Agent:
             "Bugfix improvement sketch guideline": [
                 "You should write a brief natural language description (3-5 sentences) of how the issue in the previous implementation can be fixed.",
                 "Don't suggest to do EDA.",
-            ],
+            ]
+            + (
+                [
+                    "If the previous implementation ran out of time, use the execution profile to speed up the parts where it actually spent its time."
+                ]
+                if self.cfg.exec.profile
+                else []
+            ),
         }
         prompt["Instructions"] |= self._prompt_impl_guideline
 
@@ -266,38 +321,88 @@ class Agent:
             prompt["Data Overview"] = self.data_preview
 
         plan, code = self.plan_and_code_query(prompt)
-        return Node(plan=plan, code=code, parent=parent_node)
+        with self.journal.lock:
+            return Node(plan=plan, code=code, parent=parent_node)
 
     def update_data_preview(
         self,
     ):
-        self.data_preview = data_preview.generate(self.cfg.workspace_dir)
+        self.data_preview = data_preview.generate(
+            self.cfg.workspace_dir,
+            cache_dir=(
+                self.cfg.cache_dir / "data_preview"
+                if self.acfg.data_preview_cache
+                else None
+            ),
+        )
+
+    def _reserve(self, parent_node: Node | None):
+        """Mark the selected parent as in progress so that concurrent steps pick other work."""
+        if parent_node is None:
+            self._pending_drafts += 1
+        elif parent_node.is_buggy:
+            self._busy_nodes.add(parent_node.id)
+
+    def _release(self, parent_node: Node | None):
+        if parent_node is None:
+            self._pending_drafts -= 1
+        else:
+            self._busy_nodes.discard(parent_node.id)
 
     def step(self, exec_callback: ExecCallbackType):
-        if not self.journal.nodes or self.data_preview is None:
+        if self.data_preview is None:
             self.update_data_preview()
 
-        parent_node = self.search_policy()
+        with self.journal.lock:
+            parent_node = self.search_policy()
+            self._reserve(parent_node)
         logger.debug(f"Agent is generating code, parent node type: {type(parent_node)}")
 
-        # these three functions all call the LLM to generate code
-        if parent_node is None:
-            result_node = self._draft()            
-        elif parent_node.is_buggy:
-            result_node = self._debug(parent_node)
-        else:
-            result_node = self._improve(parent_node)
- 
-        self.parse_exec_result(                                # this is where, as a wrapper, the evalution of the code happens
-            node=result_node,
-            exec_result=exec_callback(result_node.code, True), # this is where the code is to run
-        )
-        self.journal.append(result_node)
+        result_node = None
+        try:
+            # these three functions all call the LLM to generate code
+            if parent_node is None:
+                result_node = self._draft()
+            elif parent_node.is_buggy:
+                result_node = self._debug(parent_node)
+            else:
+                result_node = self._improve(parent_node)
+
+            # debug chains and improve lineages may reuse a warm kernel (the one that ran the parent's code),
+            # drafts start from a fresh one
+            reset_session = parent_node is None or not self.cfg.exec.warm_kernel
+            parent_id = parent_node.id if parent_node is not None else None
+            # this is where, as a wrapper, the evalution of the code happens
+            self.parse_exec_result(
+                node=result_node,
+                # this is where the code is to run
+                exec_result=exec_callback(
+                    result_node.code, reset_session, parent_id, result_node.id
+                ),
+            )
+            self.journal.append(result_node)
+        except BaseException:
+            # the new child is linked into its parent when it's created, if the step failed it never made it
+            # into the journal -> unlink it (otherwise e.g. a buggy parent would no longer be a leaf that gets debugged)
+            if result_node is not None and result_node.parent is not None:
+                with self.journal.lock:
+                    result_node.parent.children.discard(result_node)
+            raise
+        finally:
+            with self.journal.lock:
+                self._release(parent_node)
 
     def parse_exec_result(self, node: Node, exec_result: ExecutionResult):
         logger.info(f"Agent is parsing execution results for node {node.id}")
 
         node.absorb_exec_result(exec_result)
+        if node.term_out_file is not None:
+            # keep the complete output next to the other logs of the run
+            term_out_dir = self.cfg.log_dir / "term_out"
+            term_out_dir.mkdir(parents=True, exist_ok=True)
+            node.term_out_file = str(
+                shutil.move(node.term_out_file, term_out_dir / f"{node.id}.log.gz")
+            )
 
         # ask the LLM to review the execution results
         prompt = {
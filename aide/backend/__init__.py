@@ -1,4 +1,5 @@
 from . import backend_anthropic, backend_openai, backend_openrouter, backend_gemini
+from . import cache
 from .utils import FunctionSpec, OutputType, PromptType, compile_prompt_to_md
 import re
 import logging
@@ -30,6 +31,13 @@ provider_to_query_func = {
     "gemini": backend_gemini.query,
 }
 
+provider_to_aquery_func = {
+    "openai": backend_openai.aquery,
+    "anthropic": backend_anthropic.aquery,
+    "openrouter": backend_openrouter.aquery,
+    "gemini": backend_gemini.aquery,
+}
+
 
 def query(
     system_message: PromptType | None,
@@ -64,11 +72,69 @@ def query(
 
     provider = determine_provider(model)
     query_func = provider_to_query_func[provider]
-    output, req_time, in_tok_count, out_tok_count, info = query_func( # this is where you specify the prompt for query
-        system_message=compile_prompt_to_md(system_message) if system_message else None,
-        user_message=compile_prompt_to_md(user_message) if user_message else None,
-        func_spec=func_spec,
-        **model_kwargs,
+    system_message = compile_prompt_to_md(system_message) if system_message else None
+    user_message = compile_prompt_to_md(user_message) if user_message else None
+
+    def _query():
+        # this is where you specify the prompt for query
+        output, req_time, in_tok_count, out_tok_count, info = query_func(
+            system_message=system_message,
+            user_message=user_message,
+            func_spec=func_spec,
+            **model_kwargs,
+        )
+        return output
+
+    query_cache = cache.get_cache()
+    if query_cache is None:
+        return _query()
+    key = query_cache.make_key(system_message, user_message, func_spec, model_kwargs)
+    sequence_key = query_cache.make_sequence_key(func_spec, model_kwargs)
+    return query_cache.get_or_compute(
+        key, _query, model=model, sequence_key=sequence_key
     )
 
-    return output
+
+async def aquery(
+    system_message: PromptType | None,
+    user_message: PromptType | None,
+    model: str,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> OutputType:
+    """
+    Async version of `query`, uses the providers' async clients so that many generation
+    and review calls can be awaited concurrently from a single event loop.
+    Takes the same arguments and returns the same output as `query`.
+    """
+
+    model_kwargs = model_kwargs | {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+    provider = determine_provider(model)
+    aquery_func = provider_to_aquery_func[provider]
+    system_message = compile_prompt_to_md(system_message) if system_message else None
+    user_message = compile_prompt_to_md(user_message) if user_message else None
+
+    async def _aquery():
+        output, req_time, in_tok_count, out_tok_count, info = await aquery_func(
+            system_message=system_message,
+            user_message=user_message,
+            func_spec=func_spec,
+            **model_kwargs,
+        )
+        return output
+
+    query_cache = cache.get_cache()
+    if query_cache is None:
+        return await _aquery()
+    key = query_cache.make_key(system_message, user_message, func_spec, model_kwargs)
+    sequence_key = query_cache.make_sequence_key(func_spec, model_kwargs)
+    return await query_cache.aget_or_compute(
+        key, _aquery, model=model, sequence_key=sequence_key
+    )
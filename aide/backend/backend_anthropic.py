@@ -3,7 +3,14 @@
 import logging
 import time
 
-from .utils import FunctionSpec, OutputType, opt_messages_to_list, backoff_create
+from .utils import (
+    FunctionSpec,
+    LoopLocal,
+    OutputType,
+    abackoff_create,
+    backoff_create,
+    opt_messages_to_list,
+)
 from funcy import notnone, once, select_values
 import anthropic
 
@@ -30,17 +37,16 @@ def _setup_anthropic_client():
     _client = anthropic.Anthropic(max_retries=0)
 
 
-def query(
+_async_client = LoopLocal(lambda: anthropic.AsyncAnthropic(max_retries=0))
+
+
+def _prepare_request(
     system_message: str | None,
     user_message: str | None,
-    func_spec: FunctionSpec | None = None,
-    **model_kwargs,
-) -> tuple[OutputType, float, int, int, dict]:
-    """
-    Query Anthropic's API, optionally with tool use (Anthropic's equivalent to function calling).
-    """
-    _setup_anthropic_client()
-
+    func_spec: FunctionSpec | None,
+    model_kwargs: dict,
+) -> tuple[list[dict], dict]:
+    """Build the messages and request kwargs for the messages API."""
     filtered_kwargs: dict = select_values(notnone, model_kwargs)  # type: ignore
     if "max_tokens" not in filtered_kwargs:
         filtered_kwargs["max_tokens"] = 4096  # default for Claude models
@@ -70,16 +76,13 @@ def query(
     messages = opt_messages_to_list(None, user_message)
 
     logger.info(f"Anthropic API request: system={system_message}, user={user_message}")
+    return messages, filtered_kwargs
 
-    t0 = time.time()
-    message = backoff_create(
-        _client.messages.create,
-        ANTHROPIC_TIMEOUT_EXCEPTIONS,
-        messages=messages,
-        **filtered_kwargs,
-    )
-    req_time = time.time() - t0
 
+def _parse_response(
+    message, func_spec: FunctionSpec | None, filtered_kwargs: dict
+) -> tuple[OutputType, int, int, dict]:
+    """Extract (output, in_tokens, out_tokens, info) from a messages API response."""
     # Handle tool calls if present
     if (
         func_spec is not None
@@ -108,6 +111,68 @@ def query(
         "stop_reason": message.stop_reason,
         "model": message.model,
     }
+    return output, in_tokens, out_tokens, info
+
+
+def query(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """
+    Query Anthropic's API, optionally with tool use (Anthropic's equivalent to function calling).
+    """
+    _setup_anthropic_client()
+
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+
+    t0 = time.time()
+    message = backoff_create(
+        _client.messages.create,
+        ANTHROPIC_TIMEOUT_EXCEPTIONS,
+        messages=messages,
+        **filtered_kwargs,
+    )
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(
+        message, func_spec, filtered_kwargs
+    )
+
+    logger.info(
+        f"Anthropic API call completed - {message.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
+    )
+    logger.info(f"Anthropic API response: {output}")
+
+    return output, req_time, in_tokens, out_tokens, info
+
+
+async def aquery(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """Async version of `query` using Anthropic's async client."""
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+
+    t0 = time.time()
+    message = await abackoff_create(
+        _async_client.get().messages.create,
+        ANTHROPIC_TIMEOUT_EXCEPTIONS,
+        messages=messages,
+        **filtered_kwargs,
+    )
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(
+        message, func_spec, filtered_kwargs
+    )
 
     logger.info(
         f"Anthropic API call completed - {message.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
@@ -5,7 +5,15 @@ import logging
 import os
 import time
 
-from .utils import FunctionSpec, OutputType, opt_messages_to_list, backoff_create
+from .utils import (
+    FunctionSpec,
+    LoopLocal,
+    OutputType,
+    abackoff_create,
+    backoff_create,
+    is_func_call_unsupported,
+    opt_messages_to_list,
+)
 from funcy import notnone, once, select_values
 import openai
 
@@ -21,28 +29,31 @@ GEMINI_TIMEOUT_EXCEPTIONS = (
 )
 
 
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+
 @once
 def _setup_gemini_client():
     global _client
-    gemini_base_url = "https://generativelanguage.googleapis.com/v1beta/openai/"
-
     # Check for Gemini API key in environment variables
     api_key = os.getenv("GEMINI_API_KEY")
 
-    _client = openai.OpenAI(api_key=api_key, base_url=gemini_base_url, max_retries=0)
+    _client = openai.OpenAI(api_key=api_key, base_url=GEMINI_BASE_URL, max_retries=0)
 
 
-def query(
+_async_client = LoopLocal(
+    lambda: openai.AsyncOpenAI(
+        api_key=os.getenv("GEMINI_API_KEY"), base_url=GEMINI_BASE_URL, max_retries=0
+    )
+)
+
+
+def _prepare_request(
     system_message: str | None,
     user_message: str | None,
-    func_spec: FunctionSpec | None = None,
-    **model_kwargs,
-) -> tuple[OutputType, float, int, int, dict]:
-    """
-    Query the Gemini API via OpenAI-compatible interface, optionally with function calling.
-    If the model doesn't support function calling, gracefully degrade to text generation.
-    """
-    _setup_gemini_client()
+    func_spec: FunctionSpec | None,
+    model_kwargs: dict,
+) -> tuple[list[dict], dict]:
     filtered_kwargs: dict = select_values(notnone, model_kwargs)
 
     # Gemini doesn't allow not having user messages
@@ -59,41 +70,12 @@ def query(
         filtered_kwargs["tool_choice"] = func_spec.openai_tool_choice_dict
 
     logger.info(f"Gemini API request: system={system_message}, user={user_message}")
+    return messages, filtered_kwargs
 
-    completion = None
-    t0 = time.time()
 
-    # Attempt the API call
-    try:
-        completion = backoff_create( # this shit doesnt work
-            _client.chat.completions.create,
-            GEMINI_TIMEOUT_EXCEPTIONS,
-            messages=messages,
-            **filtered_kwargs,
-        )
-    except openai.BadRequestError as e:
-        # Check whether the error indicates that function calling is not supported
-        if "function calling" in str(e).lower() or "tools" in str(e).lower():
-            logger.warning(
-                "Function calling was attempted but is not supported by this model. "
-                "Falling back to plain text generation."
-            )
-            # Remove function-calling parameters and retry
-            filtered_kwargs.pop("tools", None)
-            filtered_kwargs.pop("tool_choice", None)
-
-            # Retry without function calling
-            completion = backoff_create(
-                _client.chat.completions.create,
-                GEMINI_TIMEOUT_EXCEPTIONS,
-                messages=messages,
-                **filtered_kwargs,
-            )
-        else:
-            # If it's some other error, re-raise
-            raise
-
-    req_time = time.time() - t0
+def _parse_response(
+    completion, func_spec: FunctionSpec | None, filtered_kwargs: dict
+) -> tuple[OutputType, int, int, dict]:
     choice = completion.choices[0]
 
     # tested on sep6, 2025, gemini-2.5-pro, works
@@ -137,6 +119,98 @@ def query(
         "model": completion.model,
         "created": getattr(completion, "created", None),
     }
+    return output, in_tokens, out_tokens, info
+
+
+def query(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """
+    Query the Gemini API via OpenAI-compatible interface, optionally with function calling.
+    If the model doesn't support function calling, gracefully degrade to text generation.
+    """
+    _setup_gemini_client()
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+
+    completion = None
+    t0 = time.time()
+
+    # Attempt the API call
+    try:
+        completion = backoff_create(  # this shit doesnt work
+            _client.chat.completions.create,
+            GEMINI_TIMEOUT_EXCEPTIONS,
+            messages=messages,
+            **filtered_kwargs,
+        )
+    except openai.BadRequestError as e:
+        if not is_func_call_unsupported(e):
+            # If it's some other error, re-raise
+            raise
+        # Remove function-calling parameters and retry without function calling
+        filtered_kwargs.pop("tools", None)
+        filtered_kwargs.pop("tool_choice", None)
+        completion = backoff_create(
+            _client.chat.completions.create,
+            GEMINI_TIMEOUT_EXCEPTIONS,
+            messages=messages,
+            **filtered_kwargs,
+        )
+
+    req_time = time.time() - t0
+    output, in_tokens, out_tokens, info = _parse_response(
+        completion, func_spec, filtered_kwargs
+    )
+
+    logger.info(
+        f"Gemini API call completed - {completion.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
+    )
+    logger.info(f"Gemini API response: {output}")
+
+    return output, req_time, in_tokens, out_tokens, info
+
+
+async def aquery(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """Async version of `query` using an async OpenAI-compatible client."""
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+    client = _async_client.get()
+
+    t0 = time.time()
+    try:
+        completion = await abackoff_create(
+            client.chat.completions.create,
+            GEMINI_TIMEOUT_EXCEPTIONS,
+            messages=messages,
+            **filtered_kwargs,
+        )
+    except openai.BadRequestError as e:
+        if not is_func_call_unsupported(e):
+            raise
+        filtered_kwargs.pop("tools", None)
+        filtered_kwargs.pop("tool_choice", None)
+        completion = await abackoff_create(
+            client.chat.completions.create,
+            GEMINI_TIMEOUT_EXCEPTIONS,
+            messages=messages,
+            **filtered_kwargs,
+        )
+
+    req_time = time.time() - t0
+    output, in_tokens, out_tokens, info = _parse_response(
+        completion, func_spec, filtered_kwargs
+    )
 
     logger.info(
         f"Gemini API call completed - {completion.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
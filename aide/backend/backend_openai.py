@@ -6,7 +6,15 @@ import os
 import re
 import time
 
-from .utils import FunctionSpec, OutputType, opt_messages_to_list, backoff_create
+from .utils import (
+    FunctionSpec,
+    LoopLocal,
+    OutputType,
+    abackoff_create,
+    backoff_create,
+    is_func_call_unsupported,
+    opt_messages_to_list,
+)
 from funcy import notnone, once, select_values
 import openai
 
@@ -45,19 +53,27 @@ def _setup_custom_client():
         )
 
 
-def query(
+_async_client = LoopLocal(
+    lambda: openai.AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL, max_retries=0
+    )
+)
+_async_custom_client = LoopLocal(
+    lambda: openai.AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        max_retries=0,
+    )
+)
+
+
+def _prepare_request(
     system_message: str | None,
     user_message: str | None,
-    func_spec: FunctionSpec | None = None,
-    **model_kwargs,
-) -> tuple[OutputType, float, int, int, dict]:
-    """
-    Query the OpenAI API, optionally with function calling.
-    If the model doesn't support function calling, gracefully degrade to text generation.
-    """
-    # Setup clients
-    _setup_openai_client()
-
+    func_spec: FunctionSpec | None,
+    model_kwargs: dict,
+) -> tuple[bool, list[dict], dict]:
+    """Build the messages and request kwargs, returns (use_chat_api, messages, filtered_kwargs)."""
     filtered_kwargs: dict = select_values(notnone, model_kwargs)
     if "max_tokens" in filtered_kwargs:
         filtered_kwargs["max_output_tokens"] = filtered_kwargs.pop("max_tokens")
@@ -75,7 +91,6 @@ def query(
     use_chat_api = os.getenv("OPENAI_BASE_URL") is not None and not is_openai_model
 
     if use_chat_api:
-        _setup_custom_client()
         # Standard chat completions API (for local servers)
         messages = opt_messages_to_list(system_message, user_message)
         if func_spec is not None:
@@ -93,63 +108,22 @@ def query(
             filtered_kwargs["tools"] = [func_spec.as_openai_responses_tool_dict]
             filtered_kwargs["tool_choice"] = func_spec.openai_responses_tool_choice_dict
 
-    logger.info(f"OpenAI API request: system={system_message}, user={user_message}")
+    return use_chat_api, messages, filtered_kwargs
 
-    t0 = time.time()
 
-    # Attempt the API call
-    try:
-        if use_chat_api:
-            # Use custom client if available, otherwise fall back to default
-            client_to_use = _custom_client if _custom_client else _client
-            response = backoff_create(
-                client_to_use.chat.completions.create,
-                OPENAI_TIMEOUT_EXCEPTIONS,
-                messages=messages,
-                **filtered_kwargs,
-            )
-        else:
-            response = backoff_create(   
-                _client.responses.create,
-                OPENAI_TIMEOUT_EXCEPTIONS,
-                input=messages,
-                **filtered_kwargs,
-            )
-    except openai.BadRequestError as e:
-        # Check whether the error indicates that function calling is not supported
-        if "function calling" in str(e).lower() or "tools" in str(e).lower():
-            logger.warning(
-                "Function calling was attempted but is not supported by this model. "
-                "Falling back to plain text generation."
-            )
-            # Remove function-calling parameters and retry
-            filtered_kwargs.pop("tools", None)
-            filtered_kwargs.pop("tool_choice", None)
-
-            # Retry without function calling
-            if use_chat_api:
-                # Use custom client if available, otherwise fall back to default
-                client_to_use = _custom_client if _custom_client else _client
-                response = backoff_create(
-                    client_to_use.chat.completions.create,
-                    OPENAI_TIMEOUT_EXCEPTIONS,
-                    messages=messages,
-                    **filtered_kwargs,
-                )
-            else:
-                response = backoff_create(
-                    _client.responses.create,
-                    OPENAI_TIMEOUT_EXCEPTIONS,
-                    input=messages,
-                    **filtered_kwargs,
-                )
-        else:
-            # If it's some other error, re-raise
-            raise
+def _create_args(
+    client, use_chat_api: bool, messages: list[dict], filtered_kwargs: dict
+) -> tuple:
+    """Select the create function of the client and its kwargs for the API in use."""
+    if use_chat_api:
+        return client.chat.completions.create, {"messages": messages} | filtered_kwargs
+    return client.responses.create, {"input": messages} | filtered_kwargs
 
-    req_time = time.time() - t0
 
-    # Parse the output based on API type
+def _parse_response(
+    response, use_chat_api: bool, func_spec: FunctionSpec | None
+) -> tuple[OutputType, int, int, dict]:
+    """Parse the output based on API type, returns (output, in_tokens, out_tokens, info)."""
     if use_chat_api:
         # Chat completions API response
         message = response.choices[0].message
@@ -230,6 +204,105 @@ def query(
         "model": response.model,
         "created": getattr(response, "created", None),
     }
+    return output, in_tokens, out_tokens, info
+
+
+def query(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """
+    Query the OpenAI API, optionally with function calling.
+    If the model doesn't support function calling, gracefully degrade to text generation.
+    """
+    # Setup clients
+    _setup_openai_client()
+
+    use_chat_api, messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+    if use_chat_api:
+        _setup_custom_client()
+    # Use custom client if available, otherwise fall back to default
+    client = _custom_client if use_chat_api and _custom_client else _client
+
+    logger.info(f"OpenAI API request: system={system_message}, user={user_message}")
+
+    t0 = time.time()
+
+    # Attempt the API call
+    try:
+        create_fn, kwargs = _create_args(
+            client, use_chat_api, messages, filtered_kwargs
+        )
+        response = backoff_create(create_fn, OPENAI_TIMEOUT_EXCEPTIONS, **kwargs)
+    except openai.BadRequestError as e:
+        if not is_func_call_unsupported(e):
+            # If it's some other error, re-raise
+            raise
+        # Remove function-calling parameters and retry without function calling
+        filtered_kwargs.pop("tools", None)
+        filtered_kwargs.pop("tool_choice", None)
+        create_fn, kwargs = _create_args(
+            client, use_chat_api, messages, filtered_kwargs
+        )
+        response = backoff_create(create_fn, OPENAI_TIMEOUT_EXCEPTIONS, **kwargs)
+
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(
+        response, use_chat_api, func_spec
+    )
+
+    logger.info(
+        f"OpenAI API call completed - {response.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
+    )
+    logger.info(f"OpenAI API response: {output}")
+
+    return output, req_time, in_tokens, out_tokens, info
+
+
+async def aquery(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """Async version of `query` using OpenAI's async client."""
+    use_chat_api, messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+    if use_chat_api and os.getenv("OPENAI_BASE_URL"):
+        client = _async_custom_client.get()
+    else:
+        client = _async_client.get()
+
+    logger.info(f"OpenAI API request: system={system_message}, user={user_message}")
+
+    t0 = time.time()
+
+    try:
+        create_fn, kwargs = _create_args(
+            client, use_chat_api, messages, filtered_kwargs
+        )
+        response = await abackoff_create(create_fn, OPENAI_TIMEOUT_EXCEPTIONS, **kwargs)
+    except openai.BadRequestError as e:
+        if not is_func_call_unsupported(e):
+            raise
+        filtered_kwargs.pop("tools", None)
+        filtered_kwargs.pop("tool_choice", None)
+        create_fn, kwargs = _create_args(
+            client, use_chat_api, messages, filtered_kwargs
+        )
+        response = await abackoff_create(create_fn, OPENAI_TIMEOUT_EXCEPTIONS, **kwargs)
+
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(
+        response, use_chat_api, func_spec
+    )
 
     logger.info(
         f"OpenAI API call completed - {response.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
@@ -7,7 +7,13 @@ import time
 from funcy import notnone, once, select_values
 import openai
 
-from .utils import FunctionSpec, OutputType, backoff_create
+from .utils import (
+    FunctionSpec,
+    LoopLocal,
+    OutputType,
+    abackoff_create,
+    backoff_create,
+)
 
 logger = logging.getLogger("aide")
 
@@ -31,13 +37,27 @@ def _setup_openrouter_client():
     )
 
 
-def query(
+_async_client = LoopLocal(
+    lambda: openai.AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        max_retries=0,
+    )
+)
+
+# provider routing preferences passed to OpenRouter with every request
+PROVIDER_PREFERENCES = {
+    "order": ["Fireworks"],
+    "ignore": ["Together", "DeepInfra", "Hyperbolic"],
+}
+
+
+def _prepare_request(
     system_message: str | None,
     user_message: str | None,
-    func_spec: FunctionSpec | None = None,
-    **model_kwargs,
-) -> tuple[OutputType, float, int, int, dict]:
-    _setup_openrouter_client()
+    func_spec: FunctionSpec | None,
+    model_kwargs: dict,
+) -> tuple[list[dict], dict]:
     filtered_kwargs: dict = select_values(notnone, model_kwargs)  # type: ignore
 
     if func_spec is not None:
@@ -53,22 +73,10 @@ def query(
     ]
 
     logger.info(f"OpenRouter API request: system={system_message}, user={user_message}")
+    return messages, filtered_kwargs
 
-    t0 = time.time()
-    completion = backoff_create(
-        _client.chat.completions.create,
-        OPENAI_TIMEOUT_EXCEPTIONS,
-        messages=messages,
-        extra_body={
-            "provider": {
-                "order": ["Fireworks"],
-                "ignore": ["Together", "DeepInfra", "Hyperbolic"],
-            },
-        },
-        **filtered_kwargs,
-    )
-    req_time = time.time() - t0
 
+def _parse_response(completion) -> tuple[OutputType, int, int, dict]:
     output = completion.choices[0].message.content
 
     in_tokens = completion.usage.prompt_tokens
@@ -79,6 +87,62 @@ def query(
         "model": completion.model,
         "created": completion.created,
     }
+    return output, in_tokens, out_tokens, info
+
+
+def query(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    _setup_openrouter_client()
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+
+    t0 = time.time()
+    completion = backoff_create(
+        _client.chat.completions.create,
+        OPENAI_TIMEOUT_EXCEPTIONS,
+        messages=messages,
+        extra_body={"provider": PROVIDER_PREFERENCES},
+        **filtered_kwargs,
+    )
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(completion)
+
+    logger.info(
+        f"OpenRouter API call completed - {completion.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
+    )
+    logger.info(f"OpenRouter API response: {output}")
+
+    return output, req_time, in_tokens, out_tokens, info
+
+
+async def aquery(
+    system_message: str | None,
+    user_message: str | None,
+    func_spec: FunctionSpec | None = None,
+    **model_kwargs,
+) -> tuple[OutputType, float, int, int, dict]:
+    """Async version of `query` using an async OpenAI-compatible client."""
+    messages, filtered_kwargs = _prepare_request(
+        system_message, user_message, func_spec, model_kwargs
+    )
+
+    t0 = time.time()
+    completion = await abackoff_create(
+        _async_client.get().chat.completions.create,
+        OPENAI_TIMEOUT_EXCEPTIONS,
+        messages=messages,
+        extra_body={"provider": PROVIDER_PREFERENCES},
+        **filtered_kwargs,
+    )
+    req_time = time.time() - t0
+
+    output, in_tokens, out_tokens, info = _parse_response(completion)
 
     logger.info(
         f"OpenRouter API call completed - {completion.model} - {req_time:.2f}s - {in_tokens + out_tokens} tokens (in: {in_tokens}, out: {out_tokens})"
@@ -0,0 +1,260 @@
+"""
+Persistent, content-addressed cache for LLM responses.
+
+Responses are keyed on everything that determines the completion (compiled system/user
+markdown, model, temperature, max_tokens, function spec and other model kwargs)
+and stored in a SQLite database with size-based (least recently used) eviction.
+
+AIDE deliberately sends identical prompts more than once when sampling at a non-zero
+temperature (e.g. the first drafts, or retries after a failed code extraction) and expects
+different completions. Sampled requests are therefore also keyed on how often the same
+request was already made in this process, so a rerun (or replay) of an experiment gets the
+n-th recorded completion for the n-th identical request. Requests with temperature 0 are
+deterministic, they always share one cache entry and concurrent identical requests are
+deduplicated in flight.
+
+The prompts of a rerun are not identical to the recorded ones (e.g. they contain execution
+times and training logs of the generated code), so each request is also recorded under its
+sequence key: the call site (model and function spec) and how many requests were made there
+before. Replay mode serves the responses of the last recorded run by their sequence keys.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from .utils import FunctionSpec, OutputType
+
+logger = logging.getLogger("aide")
+
+
+class CacheMissError(RuntimeError):
+    """Raised in replay mode when a response is not in the cache."""
+
+
+class QueryCache:
+    def __init__(self, path: Path | str, max_size_mb: int = 1024, replay=False):
+        """
+        Args:
+            path (Path | str): path of the SQLite database file (created if it doesn't exist)
+            max_size_mb (int, optional): Evict least recently used responses above this size. Defaults to 1024.
+            replay (bool, optional): Only serve cached responses and raise `CacheMissError` on a miss. Defaults to False.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size_mb * 1024 * 1024
+        self.replay = replay
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, output TEXT NOT NULL, size INTEGER NOT NULL, "
+            "model TEXT, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)"
+        )
+        # sequence key -> key of the response (of the last run that made the request)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sequence (key TEXT PRIMARY KEY, response_key TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        # number of times each request was made (to key repeated samples of the same request)
+        self._seen: Counter[str] = Counter()
+        # number of requests made at each call site (for the sequence keys)
+        self._site_counts: Counter[str] = Counter()
+        self._seen_lock = threading.Lock()
+        # in-flight requests, for deduplication of identical concurrent requests
+        self._inflight: dict[str, threading.Event] = {}
+        self._ainflight: dict[str, asyncio.Future] = {}
+
+    def make_key(
+        self,
+        system_message: str | None,
+        user_message: str | None,
+        func_spec: FunctionSpec | None,
+        model_kwargs: dict,
+    ) -> str:
+        """Compute the cache key of a (compiled) request."""
+        request = {
+            "system_message": system_message,
+            "user_message": user_message,
+            "func_spec": func_spec.to_dict() if func_spec is not None else None,
+            "model_kwargs": model_kwargs,
+        }
+        request_str = json.dumps(request, sort_keys=True, default=str)
+        key = hashlib.sha256(request_str.encode()).hexdigest()
+
+        if model_kwargs.get("temperature") == 0:
+            return key
+        with self._seen_lock:
+            sample_idx = self._seen[key]
+            self._seen[key] += 1
+        return f"{key}-{sample_idx}"
+
+    def make_sequence_key(
+        self, func_spec: FunctionSpec | None, model_kwargs: dict
+    ) -> str:
+        """Compute the sequence key of the next request at a call site (identified by the model and function spec)."""
+        site = f"{model_kwargs.get('model')}:{func_spec.name if func_spec is not None else 'text'}"
+        with self._seen_lock:
+            idx = self._site_counts[site]
+            self._site_counts[site] += 1
+        return f"{site}:{idx}"
+
+    def _record_sequence(self, sequence_key: str, key: str) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sequence VALUES (?, ?)", (sequence_key, key)
+            )
+            self._db.commit()
+
+    def _resolve_sequence(self, sequence_key: str) -> str:
+        """Key of the response that was recorded for a sequence key (replay mode)."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT response_key FROM sequence WHERE key = ?", (sequence_key,)
+            ).fetchone()
+        if row is None:
+            raise CacheMissError(
+                f"LLM cache miss in replay mode (sequence key: {sequence_key})"
+            )
+        return row[0]
+
+    def get(self, key: str) -> OutputType | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT output FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, output: OutputType, model: str | None = None) -> None:
+        output_str = json.dumps(output)
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, output_str, len(output_str), model, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        """Remove least recently used responses until the cache fits into its size limit."""
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_size:
+            return
+        freed = 0
+        evict_keys = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ):
+            evict_keys.append((key,))
+            freed += size
+            if total - freed <= self.max_size:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evict_keys)
+        logger.debug(f"LLM cache: evicted {len(evict_keys)} responses")
+
+    def _lookup(self, key: str) -> OutputType | None:
+        output = self.get(key)
+        if output is not None:
+            logger.debug(f"LLM cache hit: {key}")
+        elif self.replay:
+            raise CacheMissError(f"LLM cache miss in replay mode (key: {key})")
+        return output
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], OutputType],
+        model: str | None = None,
+        sequence_key: str | None = None,
+    ) -> OutputType:
+        """Return the cached response for `key` (or `sequence_key` in replay mode), or compute (and cache) it."""
+        if self.replay and sequence_key is not None:
+            key = self._resolve_sequence(sequence_key)
+        elif sequence_key is not None:
+            self._record_sequence(sequence_key, key)
+        while True:
+            output = self._lookup(key)
+            if output is not None:
+                return output
+            with self._seen_lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = threading.Event()
+                    break
+            # an identical request is already in flight -> wait for it and read its result
+            event.wait()
+
+        try:
+            output = compute()
+            self.put(key, output, model)
+            return output
+        finally:
+            with self._seen_lock:
+                self._inflight.pop(key).set()
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[OutputType]],
+        model: str | None = None,
+        sequence_key: str | None = None,
+    ) -> OutputType:
+        """Async version of `get_or_compute`."""
+        if self.replay and sequence_key is not None:
+            key = self._resolve_sequence(sequence_key)
+        elif sequence_key is not None:
+            self._record_sequence(sequence_key, key)
+        while True:
+            output = self._lookup(key)
+            if output is not None:
+                return output
+            fut = self._ainflight.get(key)
+            if fut is None:
+                fut = self._ainflight[key] = asyncio.get_running_loop().create_future()
+                break
+            await asyncio.shield(fut)
+
+        try:
+            output = await compute()
+            self.put(key, output, model)
+            return output
+        finally:
+            self._ainflight.pop(key)
+            fut.set_result(None)
+
+
+_cache: QueryCache | None = None
+
+
+def configure(path: Path | str, max_size_mb: int = 1024, replay=False) -> QueryCache:
+    """Enable the LLM response cache for all subsequent `query`/`aquery` calls."""
+    global _cache
+    _cache = QueryCache(path, max_size_mb=max_size_mb, replay=replay)
+    logger.info(f"Using LLM response cache at {path} (replay={replay})")
+    return _cache
+
+
+def get_cache() -> QueryCache | None:
+    return _cache
@@ -1,3 +1,5 @@
+import asyncio
+import weakref
 from dataclasses import dataclass
 
 import jsonschema
@@ -29,6 +31,50 @@ def backoff_create(
         return False
 
 
+@backoff.on_predicate(
+    wait_gen=backoff.expo,
+    max_value=60,
+    factor=1.5,
+)
+async def abackoff_create(
+    create_fn: Callable, retry_exceptions: list[Exception], *args, **kwargs
+):
+    """Async version of `backoff_create` (the backoff waits don't block the event loop)."""
+    try:
+        return await create_fn(*args, **kwargs)
+    except retry_exceptions as e:
+        logger.info(f"Backoff exception: {e}")
+        return False
+
+
+def is_func_call_unsupported(e: Exception) -> bool:
+    """Check whether the error (of a request with function calling) indicates that function calling is not supported"""
+    if "function calling" in str(e).lower() or "tools" in str(e).lower():
+        logger.warning(
+            "Function calling was attempted but is not supported by this model. "
+            "Falling back to plain text generation."
+        )
+        return True
+    return False
+
+
+class LoopLocal:
+    """
+    Lazily creates one object (e.g. an async API client) per running event loop.
+    Async clients hold connection pools that are bound to the loop they were first used in.
+    """
+
+    def __init__(self, factory: Callable):
+        self.factory = factory
+        self._objs: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._objs:
+            self._objs[loop] = self.factory()
+        return self._objs[loop]
+
+
 def opt_messages_to_list(
     system_message: str | None, user_message: str | None
 ) -> list[dict[str, str]]:
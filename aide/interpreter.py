@@ -3,26 +3,173 @@ Python interpreter for executing code snippets and capturing their output.
 Supports:
 - captures stdout and stderr
 - captures exceptions and stack traces
-- limits execution time
+- limits execution time (and optionally memory, CPU time, open files and written file sizes)
+- measures the resources (CPU time, peak memory, disk I/O) used by each execution
+- optionally profiles each execution with a sampling profiler (hot lines and functions)
+- optionally pins the children to a set of CPU cores and sizes the thread pools of numerical libraries to match
+- optionally forks each child from a pre-warmed fork server (with heavy modules already imported)
+- optionally serves repeated data loading (e.g. `pd.read_csv`) on input files from a cache
+- optionally shares input tables between children as read-only memory mapped DataFrames
+- optionally keeps a warm kernel (imported modules, memoized input data) across related executions
+- optionally forks executions from snapshots of their common prefix (code before a `# AIDE_SNAPSHOT` line)
 """
 
+import ast
+import atexit
+import ctypes
+import gzip
+import hashlib
+import importlib
 import logging
+import multiprocessing
 import os
 import queue
+import resource
 import signal
 import sys
+import tempfile
+import threading
 import time
 import traceback
+from collections import Counter, OrderedDict, deque
 from dataclasses import dataclass
-from multiprocessing import Process, Queue
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
 from pathlib import Path
+from typing import Callable
 
 import humanize
 from dataclasses_json import DataClassJsonMixin
 
+from .utils.profiler import ExecutionProfile, SamplingProfiler
+from .utils.response import trim_long_string
+
 logger = logging.getLogger("aide")
 
 
+@dataclass
+class ResourceUsage(DataClassJsonMixin):
+    """Resources used by an execution (CPU time and context switches include its terminated subprocesses)."""
+
+    cpu_user_time: float
+    cpu_sys_time: float
+    # peak resident memory during the execution, None if it can't be measured
+    peak_rss_mb: float | None
+    # bytes read from / written to the storage layer (page cache hits are not counted), None if /proc/self/io isn't readable
+    read_bytes: int | None
+    write_bytes: int | None
+    voluntary_ctx_switches: int
+    involuntary_ctx_switches: int
+
+    def describe(self) -> str:
+        parts = [
+            f"CPU time {self.cpu_user_time:.1f}s user, {self.cpu_sys_time:.1f}s sys",
+        ]
+        if self.peak_rss_mb is not None:
+            parts.append(f"peak memory {self.peak_rss_mb:.0f} MB")
+        if self.read_bytes is not None and self.write_bytes is not None:
+            parts.append(
+                f"disk I/O {humanize.naturalsize(self.read_bytes)} read, {humanize.naturalsize(self.write_bytes)} written"
+            )
+        parts.append(
+            f"context switches {self.voluntary_ctx_switches} voluntary, {self.involuntary_ctx_switches} involuntary"
+        )
+        return ", ".join(parts)
+
+    def combine(self, other: "ResourceUsage") -> "ResourceUsage":
+        """Usage of two consecutive parts of an execution (e.g. a snapshot prefix and the rest of the code)."""
+
+        def add(a, b):
+            return a + b if a is not None and b is not None else None
+
+        return ResourceUsage(
+            cpu_user_time=self.cpu_user_time + other.cpu_user_time,
+            cpu_sys_time=self.cpu_sys_time + other.cpu_sys_time,
+            peak_rss_mb=(
+                max(self.peak_rss_mb, other.peak_rss_mb)
+                if self.peak_rss_mb is not None and other.peak_rss_mb is not None
+                else self.peak_rss_mb or other.peak_rss_mb
+            ),
+            read_bytes=add(self.read_bytes, other.read_bytes),
+            write_bytes=add(self.write_bytes, other.write_bytes),
+            voluntary_ctx_switches=self.voluntary_ctx_switches
+            + other.voluntary_ctx_switches,
+            involuntary_ctx_switches=self.involuntary_ctx_switches
+            + other.involuntary_ctx_switches,
+        )
+
+
+class CPUTimeLimitExceeded(Exception):
+    """Raised in the child when an execution exceeds its CPU time limit."""
+
+
+# reported (as the exception of an execution) when the parent killed the child because it wrote too much to disk
+WRITE_LIMIT_EXCEEDED = "WriteLimitExceeded"
+
+
+def _read_proc_io(pid: int | str = "self") -> tuple[int, int] | None:
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(":") for line in f if ":" in line)
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _read_peak_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class ResourceMeter:
+    """Measures the resources used by the current process (and its terminated subprocesses) from its creation until `stop`."""
+
+    def __init__(self):
+        try:
+            # reset the peak RSS (VmHWM), which would otherwise include previous executions of a warm kernel
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+        self.start_self = resource.getrusage(resource.RUSAGE_SELF)
+        self.start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.start_io = _read_proc_io()
+
+    def stop(self) -> ResourceUsage:
+        end_self = resource.getrusage(resource.RUSAGE_SELF)
+        end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        end_io = _read_proc_io()
+
+        def delta(name: str):
+            return (getattr(end_self, name) - getattr(self.start_self, name)) + (
+                getattr(end_children, name) - getattr(self.start_children, name)
+            )
+
+        peak_rss_mb = _read_peak_rss_mb()
+        if peak_rss_mb is not None and end_children.ru_maxrss > 0:
+            # the largest terminated subprocess (ru_maxrss is in KB)
+            peak_rss_mb = max(peak_rss_mb, end_children.ru_maxrss / 1024)
+        io = None
+        if end_io is not None and self.start_io is not None:
+            io = (end_io[0] - self.start_io[0], end_io[1] - self.start_io[1])
+        return ResourceUsage(
+            cpu_user_time=delta("ru_utime"),
+            cpu_sys_time=delta("ru_stime"),
+            peak_rss_mb=peak_rss_mb,
+            read_bytes=io[0] if io is not None else None,
+            write_bytes=io[1] if io is not None else None,
+            voluntary_ctx_switches=delta("ru_nvcsw"),
+            involuntary_ctx_switches=delta("ru_nivcsw"),
+        )
+
+
 @dataclass
 class ExecutionResult(DataClassJsonMixin):
     """
@@ -35,6 +182,15 @@ class ExecutionResult(DataClassJsonMixin):
     exc_type: str | None
     exc_info: dict | None = None
     exc_stack: list[tuple] | None = None
+    # size of the complete output (term_out only contains its head and tail if it was too long)
+    out_bytes: int | None = None
+    out_lines: int | None = None
+    # temporary file with the complete (gzip compressed) output, if spilling is enabled
+    out_file: str | None = None
+    # None if the child was killed
+    resource_usage: ResourceUsage | None = None
+    # hot spots of the execution, if profiling is enabled (None if the child was killed)
+    profile: ExecutionProfile | None = None
 
 
 def exception_summary(e, working_dir, exec_file_name, format_tb_ipython):
@@ -73,21 +229,473 @@ def exception_summary(e, working_dir, exec_file_name, format_tb_ipython):
     return tb_str, e.__class__.__name__, exc_info, exc_stack
 
 
-class RedirectQueue:
-    def __init__(self, queue, timeout=5):
-        self.queue = queue
-        self.timeout = timeout
+# written to the output pipe by the child after each execution
+EOF_MARKER = b"\0<|EOF|>\0"
+# seconds the parent waits for the EOF marker after the child has reported that it's finished
+# (the marker is written before, it's only missing if the code redirected the child's stdout)
+EOF_MARKER_TIMEOUT = 10.0
+
+
+class CapturedOutput:
+    def __init__(
+        self, head_bytes: int, tail_bytes: int, spill_file: Path | None = None
+    ):
+        """
+        Output of one execution with bounded memory: only the first `head_bytes` and the last `tail_bytes`
+        are kept (plus exact byte and line counts), the full output can optionally be spilled to a gzip file.
+
+        Args:
+            head_bytes (int): number of bytes to keep from the start of the output
+            tail_bytes (int): number of bytes to keep from the end of the output
+            spill_file (Path | None, optional): Write the full (gzip compressed) output to this file. Defaults to None.
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail: deque[bytes] = deque()
+        self._tail_size = 0
+        self.num_bytes = 0
+        self.num_lines = 0
+        self._ends_with_newline = True
+        # whether the output ended with an EOF marker (otherwise it may be incomplete)
+        self.complete = False
+        self.spill_file = spill_file
+        self._spill = (
+            gzip.open(spill_file, "wb", compresslevel=1)
+            if spill_file is not None
+            else None
+        )
+
+    def add(self, data: bytes) -> None:
+        if not data:
+            return
+        self.num_bytes += len(data)
+        self.num_lines += data.count(b"\n")
+        self._ends_with_newline = data.endswith(b"\n")
+        if self._spill is not None:
+            self._spill.write(data)
+
+        if len(self.head) < self.head_bytes:
+            n = self.head_bytes - len(self.head)
+            self.head += data[:n]
+            data = data[n:]
+        if data and self.tail_bytes:
+            self.tail.append(data)
+            self._tail_size += len(data)
+            # drop chunks that are completely outside of the tail window
+            while self._tail_size - len(self.tail[0]) >= self.tail_bytes:
+                self._tail_size -= len(self.tail.popleft())
 
-    def write(self, msg):
+    def finish(self) -> None:
+        if not self._ends_with_newline:
+            # count an unterminated last line
+            self.num_lines += 1
+            self._ends_with_newline = True
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @property
+    def term_out(self) -> list[str]:
+        """The retained output, with a note on how much was left out in between head and tail."""
+        tail = b"".join(self.tail)[-self.tail_bytes :] if self.tail_bytes else b""
+        omitted = self.num_bytes - len(self.head) - len(tail)
+        if not self.num_bytes:
+            return []
+        if omitted <= 0:
+            return [(bytes(self.head) + tail).decode(errors="replace")]
+        return [
+            self.head.decode(errors="replace"),
+            f"\n ... [{omitted} bytes of output truncated] ... \n",
+            tail.decode(errors="replace"),
+        ]
+
+
+class OutputCapture:
+    def __init__(
+        self,
+        conn: Connection,
+        head_bytes: int,
+        tail_bytes: int,
+        spill_output: bool = False,
+    ):
+        """
+        Reads everything a child writes to its output pipe (in a background thread of the parent)
+        and splits it into the output of the individual executions at the EOF markers.
+
+        Args:
+            conn (Connection): read end of the child's output pipe (only its file descriptor is used)
+            head_bytes (int): number of bytes kept from the start of each execution's output
+            tail_bytes (int): number of bytes kept from the end of each execution's output
+            spill_output (bool, optional): Whether to write the full output of each execution to a temporary gzip file. Defaults to False.
+        """
+        self.conn = conn
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.spill_output = spill_output
+        self._cond = threading.Condition()
+        self._current: CapturedOutput | None = None
+        self._finished: list[CapturedOutput] = []
+        self._eof = False
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _new_output(self) -> CapturedOutput:
+        spill_file = None
+        if self.spill_output:
+            fd, path = tempfile.mkstemp(prefix="aide-term-out-", suffix=".log.gz")
+            os.close(fd)
+            spill_file = Path(path)
+        return CapturedOutput(self.head_bytes, self.tail_bytes, spill_file)
+
+    def _read(self) -> None:
+        try:
+            self._read_until_closed()
+        finally:
+            # mark the end even if reading failed, so `collect` never waits forever
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+            self.conn.close()
+
+    def _read_until_closed(self) -> None:
+        pending = b""
+        while True:
+            try:
+                data = os.read(self.conn.fileno(), 1 << 16)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            data = pending + data
+            while (idx := data.find(EOF_MARKER)) >= 0:
+                with self._cond:
+                    self._emit(data[:idx])
+                    output, self._current = self._current, None
+                    if output is None:
+                        output = self._new_output()
+                    output.finish()
+                    output.complete = True
+                    self._finished.append(output)
+                    self._cond.notify_all()
+                data = data[idx + len(EOF_MARKER) :]
+            # hold back the end of the data if it could be the start of a marker
+            keep = len(EOF_MARKER) - 1
+            while keep and not data.endswith(EOF_MARKER[:keep]):
+                keep -= 1
+            pending = data[len(data) - keep :] if keep else b""
+            with self._cond:
+                self._emit(data[: len(data) - keep])
+        with self._cond:
+            self._emit(pending)
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            if self._current is None:
+                self._current = self._new_output()
+            self._current.add(data)
+
+    def collect(self, timeout: float | None = None) -> CapturedOutput:
+        """
+        Return the output of the next execution, waits until the child has written the EOF marker
+        (or closed the pipe). After `timeout` seconds, the output read so far is returned.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._finished or self._eof, timeout=timeout)
+            if self._finished:
+                return self._finished.pop(0)
+            output, self._current = self._current, None
+            if output is None:
+                output = self._new_output()
+            output.finish()
+            return output
+
+
+def top_level_imports(code: str) -> set[str]:
+    """Return the names of the top-level packages imported by `code`."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules |= {alias.name.split(".")[0] for alias in node.names}
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+
+# environment variables that set the size of the thread pools of numerical libraries (and of joblib's n_jobs=-1)
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "LOKY_MAX_CPU_COUNT",
+]
+
+
+def partition_cpus(num_parts: int) -> list[list[int]]:
+    """
+    Split the CPU cores this process may run on into `num_parts` contiguous slices (whose sizes differ by at most one),
+    if there are fewer cores than parts, the cores are shared round-robin.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    if num_parts > len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(num_parts)]
+    size, rest = divmod(len(cpus), num_parts)
+    parts = []
+    start = 0
+    for i in range(num_parts):
+        end = start + size + (1 if i < rest else 0)
+        parts.append(cpus[start:end])
+        start = end
+    return parts
+
+
+def limit_threads(num_threads: int) -> None:
+    """Limit the thread pools of numerical libraries (already imported ones and ones that are imported later)."""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+
+        # BLAS/OpenMP libraries that were loaded before the environment variables were set (e.g. by the fork server)
+        threadpool_limits(num_threads)
+    except ImportError:
+        pass
+    if "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(num_threads)
+
+
+# code before a line with only this comment is run once in a snapshot template, executions of code
+# with the same prefix are forked from it and only run the rest of the code
+SNAPSHOT_MARKER = "# AIDE_SNAPSHOT"
+
+
+def split_at_snapshot_marker(code: str) -> tuple[str, str, int] | None:
+    """Split code at the snapshot marker, returns the prefix, the suffix and the number of lines up to the marker (or None)."""
+    lines = code.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if line.strip() == SNAPSHOT_MARKER:
+            return "".join(lines[:i]), "".join(lines[i + 1 :]), i + 1
+    return None
+
+
+class ForkedProcess:
+    """A minimal `multiprocessing.Process`-like handle for a child forked by the fork server."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._alive = True
+
+    def is_alive(self) -> bool:
+        if self._alive:
+            try:
+                os.kill(self.pid, 0)
+                # an orphaned child may remain a zombie until it is reaped
+                with open(f"/proc/{self.pid}/stat") as f:
+                    self._alive = f.read().rsplit(")", 1)[1].split()[0] != "Z"
+            except ProcessLookupError:
+                self._alive = False
+            except OSError:
+                pass
+        return self._alive
+
+    @property
+    def exitcode(self) -> int | None:
+        # the fork server reaps its children, so the actual exit status isn't available
+        return None if self.is_alive() else 0
+
+    def terminate(self) -> None:
+        self._signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self._signal(signal.SIGKILL)
+
+    def _signal(self, sig: int) -> None:
         try:
-            self.queue.put(msg, timeout=self.timeout)
-        except queue.Full:
-            logger.warning("Queue write timed out")
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            self._alive = False
 
-    def flush(self):
+    def join(self, timeout: float | None = None) -> None:
+        deadline = None if timeout is None else time.time() + timeout
+        while self.is_alive() and (deadline is None or time.time() < deadline):
+            time.sleep(0.01)
+
+    def close(self) -> None:
         pass
 
 
+def serve_forks(
+    conn: Connection,
+    preload_modules: list[str],
+    child_main: Callable[[Connection, Connection], None],
+    prefix_cost: tuple[float, ResourceUsage] | None = None,
+) -> None:
+    """Main loop of the fork server's template process (`prefix_cost` is reported to the parent when it's ready)."""
+    # forked children are reaped automatically, Ctrl+C is handled by the parent
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loaded = []
+    for module in preload_modules:
+        try:
+            importlib.import_module(module)
+            loaded.append(module)
+        except Exception:
+            pass
+    conn.send(("state:ready", loaded, prefix_cost))
+
+    while True:
+        try:
+            conn.recv()
+            ctrl_fd = recv_handle(conn)
+            out_fd = recv_handle(conn)
+        except (EOFError, OSError):
+            return
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            conn.close()
+            try:
+                child_main(Connection(ctrl_fd), Connection(out_fd))
+            finally:
+                os._exit(0)
+        os.close(ctrl_fd)
+        os.close(out_fd)
+        conn.send(pid)
+
+
+def serve_snapshot(
+    conn: Connection,
+    preload_modules: list[str],
+    child_main: Callable[[Connection, Connection], None],
+    prefix: str,
+) -> None:
+    """Main loop of a snapshot template: runs the prefix of the code once, then forks children that inherit its state."""
+    interpreter: Interpreter = child_main.__self__  # type: ignore
+    interpreter.child_env_setup()
+    # the prefix is part of the executed code, so it's subject to the same resource limits
+    interpreter._set_limits()
+    # the output of the prefix is replayed by every child
+    with tempfile.TemporaryFile() as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        # trunk-ignore(mypy/assignment)
+        sys.stdout = sys.stderr = open(1, "w", buffering=1, closefd=False)
+        global_scope: dict = {}
+        start_time = time.time()
+        meter = ResourceMeter()
+        interpreter._limit_cpu_time(interpreter.max_cpu_seconds)
+        try:
+            exec(compile(prefix, interpreter.agent_file_name, "exec"), global_scope)
+        except BaseException as e:
+            conn.send(("state:failed", f"{e.__class__.__name__}: {e}"))
+            return
+        interpreter._limit_cpu_time(None)
+        prefix_cost = (time.time() - start_time, meter.stop())
+        interpreter._flush_output()
+        f.seek(0)
+        interpreter._snapshot = (global_scope, f.read())
+    serve_forks(conn, preload_modules, child_main, prefix_cost)
+
+
+class ForkServer:
+    def __init__(
+        self,
+        preload_modules: list[str],
+        child_main: Callable[[Connection, Connection], None],
+        snapshot_prefix: str | None = None,
+    ):
+        """
+        Template process that imports a set of (heavy) modules once and then forks
+        a fresh child for each execution, so the children start with these modules already imported.
+
+        Args:
+            preload_modules (list[str]): modules to import in the template process
+            child_main (Callable[[Connection, Connection], None]): run in each forked child with its control and output connections (must be picklable)
+            snapshot_prefix (str | None, optional): Code that the template runs before forking (see `serve_snapshot`),
+                `child_main` must be a method of the Interpreter. Defaults to None.
+        """
+        self.preload_modules = preload_modules
+        self._lock = threading.Lock()
+        self._ready = False
+        # seconds and resources used by the snapshot prefix (set once the template is ready)
+        self.prefix_cost: tuple[float, ResourceUsage] | None = None
+        # the template is spawned (not forked), so it doesn't inherit the connections of other children
+        # and exits as soon as we close our end of its connection.
+        # it's not a daemon, since the forked children would inherit the flag and then couldn't start processes themselves
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        if snapshot_prefix is None:
+            self.process = ctx.Process(
+                target=serve_forks, args=(child_conn, preload_modules, child_main)
+            )
+        else:
+            self.process = ctx.Process(
+                target=serve_snapshot,
+                args=(child_conn, preload_modules, child_main, snapshot_prefix),
+            )
+        self.process.start()
+        child_conn.close()
+        atexit.register(self.close)
+
+    def _wait_ready(self, block: bool) -> bool:
+        if not self._ready and (block or self.conn.poll()):
+            msg = self.conn.recv()
+            if msg[0] == "state:failed":
+                raise RuntimeError(msg[1])
+            logger.debug(f"Fork server ready, preloaded modules: {msg[1]}")
+            self.prefix_cost = msg[2]
+            self._ready = True
+        return self._ready
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        """Wait until the template is ready (False on timeout), raises RuntimeError if a snapshot prefix failed."""
+        with self._lock:
+            if not self._ready and not self.conn.poll(timeout):
+                return False
+            return self._wait_ready(block=True)
+
+    def is_ready(self) -> bool:
+        """Check (without blocking) whether the template has finished importing its modules."""
+        with self._lock:
+            return self._wait_ready(block=False)
+
+    def fork(self) -> tuple[ForkedProcess, Connection, Connection]:
+        """Fork a new child, returns its process handle and the parent ends of its control and output connections."""
+        ctrl_conn, child_ctrl_conn = Pipe()
+        out_conn, child_out_conn = Pipe(duplex=False)
+        with self._lock:
+            # blocks until the template has imported all modules
+            self._wait_ready(block=True)
+            self.conn.send("fork")
+            send_handle(self.conn, child_ctrl_conn.fileno(), self.process.pid)
+            send_handle(self.conn, child_out_conn.fileno(), self.process.pid)
+            pid = self.conn.recv()
+        child_ctrl_conn.close()
+        child_out_conn.close()
+        return ForkedProcess(pid), ctrl_conn, out_conn
+
+    def kill(self) -> None:
+        """Stop the template right away (e.g. while it is still running a snapshot prefix)."""
+        self.close()
+        self.process.kill()
+
+    def close(self) -> None:
+        """Stop the template (children that were already forked keep running)."""
+        if self.conn.closed:
+            return
+        # the template exits once it reads EOF, it's joined by multiprocessing at the latest on exit
+        self.conn.close()
+        atexit.unregister(self.close)
+
+
 class Interpreter:
     def __init__(
         self,
@@ -95,6 +703,30 @@ class Interpreter:
         timeout: int = 3600,
         format_tb_ipython: bool = False,
         agent_file_name: str = "runfile.py",
+        fork_server: bool = False,
+        preload_modules: list[str] | None = None,
+        adaptive_preload: bool = True,
+        output_head_bytes: int = 32768,
+        output_tail_bytes: int = 32768,
+        spill_output: bool = False,
+        loader_cache: bool = False,
+        loader_cache_dir: Path | str | None = None,
+        loader_cache_max_mb: int = 10240,
+        shared_tables: list[str] | None = None,
+        shared_data_dir: Path | str | None = None,
+        warm_kernel: bool = False,
+        warm_kernel_max_memory_mb: int = 8192,
+        snapshots: bool = False,
+        max_snapshots: int = 2,
+        max_memory_mb: int | None = None,
+        max_cpu_seconds: int | None = None,
+        max_open_files: int | None = None,
+        max_single_file_mb: int | None = None,
+        max_written_mb: int | None = None,
+        profile: bool = False,
+        profile_interval: float = 0.01,
+        profile_top_n: int = 10,
+        cpu_cores: list[int] | None = None,
     ):
         """
         Simulates a standalone Python REPL with an execution time limit.
@@ -104,6 +736,37 @@ class Interpreter:
             timeout (int, optional): Timeout for each code execution step. Defaults to 3600.
             format_tb_ipython (bool, optional): Whether to use IPython or default python REPL formatting for exceptions. Defaults to False.
             agent_file_name (str, optional): The name for the agent's code file. Defaults to "runfile.py".
+            fork_server (bool, optional): Whether to fork children from a pre-warmed template process (the next child is always pre-spawned). Defaults to False.
+            preload_modules (list[str] | None, optional): Modules that the fork server imports before forking. Defaults to None.
+            adaptive_preload (bool, optional): Whether the fork server also preloads modules that executed code imported repeatedly. Defaults to True.
+            output_head_bytes (int, optional): Bytes kept from the start of each execution's output. Defaults to 32768.
+            output_tail_bytes (int, optional): Bytes kept from the end of each execution's output. Defaults to 32768.
+            spill_output (bool, optional): Whether to also write the complete output of each execution to a gzip file. Defaults to False.
+            loader_cache (bool, optional): Whether to serve `pd.read_csv` (and `np.loadtxt`) calls on input files from a cache (see `utils.loader_cache`). Defaults to False.
+            loader_cache_dir (Path | str | None, optional): Directory of the loader cache. Defaults to a directory in the system's temp dir.
+            loader_cache_max_mb (int, optional): Size limit of the loader cache (least recently used results are evicted). Defaults to 10240.
+            shared_tables (list[str] | None, optional): Input tables (paths relative to the input dir) that are loaded once into a memory mapped store,
+                which children access through `aide_data.load_table` (see `utils.shared_data`). Defaults to None.
+            shared_data_dir (Path | str | None, optional): Directory of the shared table store. Defaults to a directory in the system's temp dir.
+            warm_kernel (bool, optional): Whether executions with `reset_session=False` reuse the child (with its imported modules and memoized
+                input data, see `utils.loader_cache`) but run in a fresh global scope. Defaults to False.
+            warm_kernel_max_memory_mb (int, optional): A warm kernel is restarted once it uses more memory than this,
+                up to half of it is used to memoize input data. Defaults to 8192.
+            snapshots (bool, optional): Whether code with a snapshot marker (see `SNAPSHOT_MARKER`) is forked from a template
+                that has already run the code before the marker (and is kept for later code with the same prefix). Defaults to False.
+            max_snapshots (int, optional): Number of snapshot templates that are kept (least recently used ones are stopped). Defaults to 2.
+            max_memory_mb (int | None, optional): Limit of the child's address space (allocations beyond it raise a MemoryError). Defaults to None.
+            max_cpu_seconds (int | None, optional): CPU time limit of each execution (raises `CPUTimeLimitExceeded`). Defaults to None.
+            max_open_files (int | None, optional): Limit of the number of files the child can open. Defaults to None.
+            max_single_file_mb (int | None, optional): Limit of the size of each file the child writes (writes beyond it raise an OSError),
+                it applies to every file on its own, not to the total number of written bytes. Defaults to None.
+            max_written_mb (int | None, optional): Limit of the total number of bytes each execution writes to disk (the child is killed once it
+                exceeds it, checked every second, writes to tmpfs and of subprocesses that are still running aren't counted). Defaults to None.
+            profile (bool, optional): Whether to profile each execution with a sampling profiler (see `utils.profiler`). Defaults to False.
+            profile_interval (float, optional): Seconds between the profiler's samples. Defaults to 0.01.
+            profile_top_n (int, optional): Number of hot lines and functions kept in each profile. Defaults to 10.
+            cpu_cores (list[int] | None, optional): CPU cores the children are pinned to (see `partition_cpus`), the thread pools
+                of numerical libraries are limited to their number. Defaults to None (no limit).
         """
         # this really needs to be a path, otherwise causes issues that don't raise exc
         self.working_dir = Path(working_dir).resolve()
@@ -113,9 +776,73 @@ class Interpreter:
         self.timeout = timeout
         self.format_tb_ipython = format_tb_ipython
         self.agent_file_name = agent_file_name
-        self.process: Process = None  # type: ignore
+        self.process: Process | ForkedProcess = None  # type: ignore
+
+        self.fork_server: ForkServer | None = None
+        self._next_fork_server: ForkServer | None = None
+        self._spare: tuple[ForkedProcess, Connection, Connection] | None = None
+        self.preload_modules = ["shutup"] + list(preload_modules or [])
+        self.adaptive_preload = adaptive_preload
+        self.output_head_bytes = output_head_bytes
+        self.output_tail_bytes = output_tail_bytes
+        self.spill_output = spill_output
+        self.loader_cache = loader_cache
+        self.warm_kernel = warm_kernel
+        self.warm_kernel_max_memory_mb = warm_kernel_max_memory_mb
+        # id of the node whose code last ran in the current child (a warm kernel is only reused by its children)
+        self.kernel_node_id: str | None = None
+        self._kernel_invalidated = False
+        self.loader_cache_dir = Path(
+            loader_cache_dir or Path(tempfile.gettempdir()) / "aide_loader_cache"
+        ).resolve()
+        self.loader_cache_max_mb = loader_cache_max_mb
+        self._import_counts: Counter[str] = Counter()
+        self.snapshots = snapshots
+        self.max_snapshots = max_snapshots
+        # snapshot templates by the hash of their prefix, prefixes that failed
+        self._snapshots: OrderedDict[str, ForkServer] = OrderedDict()
+        self._failed_snapshots: set[str] = set()
+        # (global scope, output) of the prefix, set in snapshot templates
+        self._snapshot: tuple[dict, bytes] | None = None
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.max_open_files = max_open_files
+        self.max_single_file_mb = max_single_file_mb
+        self.max_written_mb = max_written_mb
+        self.profile = profile
+        self.profile_interval = profile_interval
+        self.profile_top_n = profile_top_n
+        self.cpu_cores = cpu_cores
+        # table name -> directory of its column store
+        self.shared_tables: dict[str, str] = {}
+        if shared_tables:
+            from .utils import shared_data
+
+            self.shared_tables = shared_data.build_tables(
+                self.working_dir / "input",
+                shared_tables,
+                Path(shared_data_dir or Path(tempfile.gettempdir()) / "aide_shared"),
+            )
+        if fork_server:
+            self.fork_server = ForkServer(self.preload_modules, self._run_session)
+
+    def __getstate__(self) -> dict:
+        # only the settings are needed in the fork server's template (the rest are parent-side handles)
+        state = self.__dict__.copy()
+        for key in [
+            "process",
+            "fork_server",
+            "_next_fork_server",
+            "_spare",
+            "ctrl_conn",
+            "output",
+            "_snapshots",
+            "_failed_snapshots",
+        ]:
+            state.pop(key, None)
+        return state
 
-    def child_proc_setup(self, result_outq: Queue) -> None:
+    def child_env_setup(self) -> None:
         # disable all warnings (before importing anything)
         import shutup
 
@@ -126,58 +853,315 @@ class Interpreter:
         # a .py file should be able to import modules from the cwd anyway
         sys.path.append(str(self.working_dir))
 
-        # capture stdout and stderr
+        if self.cpu_cores:
+            # before loading any data (subprocesses of the executed code inherit the core set and thread limits)
+            os.sched_setaffinity(0, self.cpu_cores)
+            limit_threads(len(self.cpu_cores))
+
+        if self.loader_cache or self.warm_kernel:
+            from .utils import loader_cache
+
+            loader_cache.install(
+                self.working_dir / "input",
+                self.loader_cache_dir if self.loader_cache else None,
+                memo_max_bytes=(
+                    self.warm_kernel_max_memory_mb * 1024 * 1024 // 2
+                    if self.warm_kernel
+                    else 0
+                ),
+                max_bytes=self.loader_cache_max_mb * 1024 * 1024,
+            )
+
+        if self.shared_tables:
+            from .utils import shared_data
+
+            shared_data.configure(self.shared_tables)
+
+    def _set_limits(self) -> None:
+        limits = [
+            (resource.RLIMIT_AS, self.max_memory_mb, 1024 * 1024),
+            (resource.RLIMIT_NOFILE, self.max_open_files, 1),
+            (resource.RLIMIT_FSIZE, self.max_single_file_mb, 1024 * 1024),
+        ]
+        for rlimit, value, unit in limits:
+            if value is None:
+                continue
+            _, hard = resource.getrlimit(rlimit)
+            limit = value * unit
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(rlimit, (limit, limit))
+        if self.max_single_file_mb is not None:
+            # fail the write with an OSError instead of terminating the child
+            signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+        if self.max_cpu_seconds is not None:
+
+            def on_cpu_limit(signum, frame):
+                raise CPUTimeLimitExceeded(
+                    f"Execution exceeded the CPU time limit of {self.max_cpu_seconds}s"
+                )
+
+            signal.signal(signal.SIGXCPU, on_cpu_limit)
+
+    def _limit_cpu_time(self, seconds: int | None) -> None:
+        """Set the CPU time limit of the next execution (RLIMIT_CPU counts the CPU time of the whole process)."""
+        if self.max_cpu_seconds is None:
+            return
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        limit = hard
+        if seconds is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            limit = int(usage.ru_utime + usage.ru_stime) + seconds
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+    def child_proc_setup(self, out_conn: Connection) -> None:
+        self.child_env_setup()
+        self._set_limits()
+
+        # capture stdout and stderr at the file descriptor level (so that output of native code is
+        # captured too) in the output pipe, the parent reads it in large chunks
+        os.dup2(out_conn.fileno(), 1)
+        os.dup2(out_conn.fileno(), 2)
+        out_conn.close()
         # trunk-ignore(mypy/assignment)
-        sys.stdout = sys.stderr = RedirectQueue(result_outq) # interesting way to redirect output to a queue
+        sys.stdout = sys.stderr = open(1, "w", buffering=1, closefd=False)
 
-    def _run_session(
-        self, code_inq: Queue, result_outq: Queue, event_outq: Queue
-    ) -> None:
-        self.child_proc_setup(result_outq)
+    def _flush_output(self) -> None:
+        for stream in [sys.stdout, sys.__stdout__]:
+            try:
+                stream.flush()  # type: ignore
+            except Exception:
+                pass
+        try:
+            # output of native code (e.g. lightgbm) may still be in the C stdio buffers
+            ctypes.CDLL(None).fflush(None)
+        except Exception:
+            pass
+
+    def _finish_output(self) -> None:
+        """Flush all output of the current execution and mark its end."""
+        self._flush_output()
+        os.write(1, EOF_MARKER)
+
+    def _run_session(self, ctrl_conn: Connection, out_conn: Connection) -> None:
+        self.child_proc_setup(out_conn)
+        stdout = sys.stdout
 
         global_scope: dict = {}
         while True:
-            code = code_inq.get() #copilot said this will keep waiting until a code arrive from parent
+            try:
+                # copilot said this will keep waiting until a code arrive from parent
+                code = ctrl_conn.recv()
+            except EOFError:
+                # the parent has closed the connection (e.g. it exited while this child was waiting)
+                return
             os.chdir(str(self.working_dir))
             with open(self.agent_file_name, "w") as f:
                 f.write(code)
+            if self.warm_kernel:
+                # warm kernels only keep modules and memoized data, not the variables of previous executions
+                global_scope = {}
 
-            event_outq.put(("state:ready",))
+            source = code
+            split = split_at_snapshot_marker(code)
+            if self._snapshot is not None and split is not None:
+                # forked from a snapshot template -> continue after the marker with the prefix's state and output
+                global_scope, prefix_output = self._snapshot
+                self._snapshot = None
+                _, suffix, num_prefix_lines = split
+                # keep the line numbers of the complete file (for tracebacks)
+                code = "\n" * num_prefix_lines + suffix
+                os.write(1, prefix_output)
+
+            ctrl_conn.send(("state:ready",))
+            meter = ResourceMeter()
+            profiler = None
+            if self.profile:
+                profiler = SamplingProfiler(
+                    self.agent_file_name, self.profile_interval, self.profile_top_n
+                )
+            self._limit_cpu_time(self.max_cpu_seconds)
             try:
                 exec(compile(code, self.agent_file_name, "exec"), global_scope)
             except BaseException as e:
+                # no SIGXCPU while reporting the exception or waiting for the next execution
+                self._limit_cpu_time(None)
+                profile = profiler.stop(source) if profiler is not None else None
                 tb_str, e_cls_name, exc_info, exc_stack = exception_summary(
                     e,
                     self.working_dir,
                     self.agent_file_name,
                     self.format_tb_ipython,
                 )
-                result_outq.put(tb_str)
+                # the executed code may have replaced sys.stdout
+                sys.stdout = sys.stderr = stdout
+                stdout.write(tb_str)
                 if e_cls_name == "KeyboardInterrupt":
                     e_cls_name = "TimeoutError"
 
-                event_outq.put(("state:finished", e_cls_name, exc_info, exc_stack))
+                # mark the end of the output before reporting completion (so the parent doesn't miss any of it)
+                self._finish_output()
+                ctrl_conn.send(
+                    (
+                        "state:finished",
+                        e_cls_name,
+                        exc_info,
+                        exc_stack,
+                        meter.stop(),
+                        profile,
+                    )
+                )
             else:
-                event_outq.put(("state:finished", None, None, None))
+                self._limit_cpu_time(None)
+                profile = profiler.stop(source) if profiler is not None else None
+                self._finish_output()
+                ctrl_conn.send(
+                    ("state:finished", None, None, None, meter.stop(), profile)
+                )
 
             # remove the file after execution (otherwise it might be included in the data preview)
             os.remove(self.agent_file_name)
 
-            # put EOF marker to indicate that we're done
-            result_outq.put("<|EOF|>")
-
-    def create_process(self) -> None:
-        # we use three queues to communicate with the child process:
-        # - code_inq: send code to child to execute
-        # - result_outq: receive stdout/stderr from child
-        # - event_outq: receive events from child (e.g. state:ready, state:finished)
-        # trunk-ignore(mypy/var-annotated)
-        self.code_inq, self.result_outq, self.event_outq = Queue(), Queue(), Queue()
-        self.process = Process(
-            target=self._run_session,
-            args=(self.code_inq, self.result_outq, self.event_outq),
+    def _spawn_child(self) -> tuple[Process | ForkedProcess, Connection, Connection]:
+        # we use two pipes to communicate with the child process:
+        # - ctrl_conn: send code to child to execute and receive events from child (e.g. state:ready, state:finished)
+        # - out_conn: raw pipe that receives stdout/stderr of the child
+        if self.fork_server is not None:
+            return self.fork_server.fork()
+        ctrl_conn, child_ctrl_conn = Pipe()
+        out_conn, child_out_conn = Pipe(duplex=False)
+        process = Process(
+            target=self._run_session, args=(child_ctrl_conn, child_out_conn)
         )
-        self.process.start()
+        process.start()
+        child_ctrl_conn.close()
+        child_out_conn.close()
+        return process, ctrl_conn, out_conn
+
+    def _update_fork_server(self) -> None:
+        """Switch to a fork server with an extended set of preloaded modules once it is ready."""
+        if self._next_fork_server is not None and self._next_fork_server.is_ready():
+            self.fork_server.close()  # type: ignore
+            self.fork_server, self._next_fork_server = self._next_fork_server, None
+
+    def _learn_imports(self, code: str) -> None:
+        """Start a new fork server that also preloads the modules which were imported repeatedly."""
+        self._import_counts.update(top_level_imports(code))
+        new_modules = [
+            m
+            for m, count in self._import_counts.items()
+            if count >= 2 and m not in self.preload_modules
+        ]
+        if not new_modules or self._next_fork_server is not None:
+            return
+        self.preload_modules += sorted(new_modules)
+        logger.debug(f"Fork server will additionally preload {new_modules}")
+        self._next_fork_server = ForkServer(self.preload_modules, self._run_session)
+
+    def _get_snapshot(self, prefix: str) -> ForkServer | None:
+        """Return the snapshot template of `prefix` (created if there isn't one), None if the prefix fails."""
+        key = hashlib.sha256(prefix.encode()).hexdigest()
+        if key in self._failed_snapshots:
+            return None
+        if key in self._snapshots:
+            self._snapshots.move_to_end(key)
+            return self._snapshots[key]
+
+        logger.info("Creating a snapshot of the code before the snapshot marker")
+        snapshot = ForkServer(
+            self.preload_modules, self._run_session, snapshot_prefix=prefix
+        )
+        try:
+            if not snapshot.wait_ready(timeout=self.timeout):
+                raise RuntimeError(f"timeout of {self.timeout}s exceeded")
+        except RuntimeError as e:
+            # the complete code is executed instead (e.g. to report the exception)
+            logger.info(f"Snapshot failed ({e}), executing the complete code")
+            snapshot.kill()
+            self._failed_snapshots.add(key)
+            return None
+
+        self._snapshots[key] = snapshot
+        while len(self._snapshots) > self.max_snapshots:
+            _, old_snapshot = self._snapshots.popitem(last=False)
+            old_snapshot.close()
+        return snapshot
+
+    def create_process(self, snapshot: ForkServer | None = None) -> None:
+        self.kernel_node_id = None
+        self._kernel_invalidated = False
+        if snapshot is not None:
+            self.process, self.ctrl_conn, out_conn = snapshot.fork()
+        elif self._spare is not None:
+            self.process, self.ctrl_conn, out_conn = self._spare
+            self._spare = None
+        else:
+            self.process, self.ctrl_conn, out_conn = self._spawn_child()
+        self.output = OutputCapture(
+            out_conn,
+            self.output_head_bytes,
+            self.output_tail_bytes,
+            self.spill_output,
+        )
+
+        if self.fork_server is not None and self._spare is None:
+            # pre-spawn the child for the next execution
+            self._update_fork_server()
+            self._spare = self._spawn_child()
+
+    def _get_event(self, timeout: float) -> tuple:
+        """Receive the next event from the child, raises queue.Empty if there is none within `timeout`."""
+        if self.ctrl_conn.poll(timeout):
+            try:
+                return self.ctrl_conn.recv()
+            except EOFError:
+                # the child has exited, the caller checks whether this was expected
+                time.sleep(timeout)
+        raise queue.Empty
+
+    def _kernel_memory_mb(self) -> float | None:
+        """Resident memory of the child (None if unknown)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def invalidate_kernel(self) -> None:
+        """Don't reuse the current child for the next execution (e.g. because the input data changed)."""
+        self._kernel_invalidated = True
+
+    def _kernel_reusable(self, parent_id: str | None = None) -> bool:
+        if self.process is None or not self.process.is_alive():
+            return False
+        if self._kernel_invalidated:
+            return False
+        if parent_id is not None and parent_id != self.kernel_node_id:
+            # the child has run code of another lineage
+            return False
+        if self.warm_kernel:
+            memory_mb = self._kernel_memory_mb()
+            if memory_mb is not None and memory_mb > self.warm_kernel_max_memory_mb:
+                logger.info(
+                    f"Restarting the warm kernel, it uses {memory_mb:.0f} MB of memory"
+                )
+                return False
+        return True
+
+    def interrupt(self) -> None:
+        """Kill the child of the current execution (called from another thread), `run` then raises a RuntimeError."""
+        process = self.process
+        if process is None or process.pid is None:
+            return
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
 
     def cleanup_session(self):
         if self.process is None:
@@ -201,14 +1185,23 @@ class Interpreter:
             if self.process is not None:
                 self.process.close()
                 self.process = None
+                self.ctrl_conn.close()
 
-    def run(self, code: str, reset_session=True) -> ExecutionResult:
+    def run(
+        self,
+        code: str,
+        reset_session=True,
+        parent_id: str | None = None,
+        node_id: str | None = None,
+    ) -> ExecutionResult:
         """
         Execute the provided Python command in a separate process and return its output.
 
         Parameters:
             code (str): Python code to execute.
             reset_session (bool, optional): Whether to reset the interpreter session before executing the code. Defaults to True.
+            parent_id (str | None, optional): If given, the session is only kept if it last ran the code of this node. Defaults to None.
+            node_id (str | None, optional): Id of the node whose code is executed (for later `parent_id` checks). Defaults to None.
 
         Returns:
             ExecutionResult: Object containing the output and metadata of the code execution.
@@ -217,30 +1210,50 @@ class Interpreter:
 
         logger.debug(f"REPL is executing code (reset_session={reset_session})")
 
-        if reset_session:
+        if self.fork_server is not None and self.adaptive_preload:
+            self._learn_imports(code)
+
+        # time and resources used to create a snapshot for this execution, they are counted as part of it
+        prefix_time = 0.0
+        prefix_usage = None
+        # the session is also reset if the previous child exited (e.g. after a timeout) or a warm kernel uses too much memory
+        if reset_session or not self._kernel_reusable(parent_id):
             if self.process is not None:
                 # terminate and clean up previous process
                 self.cleanup_session()
-            self.create_process()
-        else:
-            # reset_session needs to be True on first exec
-            assert self.process is not None
+            snapshot = None
+            if self.snapshots and (split := split_at_snapshot_marker(code)):
+                snapshot_start = time.time()
+                snapshot = self._get_snapshot(split[0])
+                if snapshot is None:
+                    # the prefix failed (or timed out), the complete code is executed
+                    prefix_time = time.time() - snapshot_start
+                elif snapshot.prefix_cost is not None:
+                    # only the execution that created the snapshot ran the prefix
+                    prefix_time, prefix_usage = snapshot.prefix_cost
+                    snapshot.prefix_cost = None
+            self.create_process(snapshot)
 
         assert self.process.is_alive()
 
-        self.code_inq.put(code)
+        self.kernel_node_id = node_id
+        self.ctrl_conn.send(code)
 
         # wait for child to actually start execution (we don't want interrupt child setup)
         try:
-            state = self.event_outq.get(timeout=20)
+            state = self._get_event(timeout=20)
         except queue.Empty:
             msg = "REPL child process failed to start execution"
             logger.critical(msg)
-            while not self.result_outq.empty():
-                logger.error(f"REPL output queue dump: {self.result_outq.get()}")
+            logger.error(f"REPL output dump: {self.output.collect(timeout=1).term_out}")
             raise RuntimeError(msg) from None
         assert state[0] == "state:ready", state
-        start_time = time.time()
+        # the prefix counts against the timeout (and in the execution time)
+        start_time = time.time() - prefix_time
+        # bytes the child had written before this execution (a warm kernel is reused)
+        start_io = (
+            _read_proc_io(self.process.pid) if self.max_written_mb is not None else None
+        )
 
         # this flag indicates that the child ahs exceeded the time limit and an interrupt was sent
         # if the child process dies without this flag being set, it's an unexpected termination
@@ -249,7 +1262,7 @@ class Interpreter:
         while True:
             try:
                 # check if the child is done
-                state = self.event_outq.get(timeout=1)  # wait for state:finished
+                state = self._get_event(timeout=1)  # wait for state:finished
                 assert state[0] == "state:finished", state
                 exec_time = time.time() - start_time
                 break
@@ -258,12 +1271,26 @@ class Interpreter:
                 if not child_in_overtime and not self.process.is_alive():
                     msg = "REPL child process died unexpectedly"
                     logger.critical(msg)
-                    while not self.result_outq.empty():
-                        logger.error(
-                            f"REPL output queue dump: {self.result_outq.get()}"
-                        )
+                    logger.error(
+                        f"REPL output dump: {self.output.collect(timeout=1).term_out}"
+                    )
                     raise RuntimeError(msg) from None
 
+                # .. or kill it if it wrote too much to disk
+                if start_io is not None and not child_in_overtime:
+                    io = _read_proc_io(self.process.pid)
+                    if (
+                        io is not None
+                        and io[1] - start_io[1] > self.max_written_mb * 1024 * 1024
+                    ):
+                        logger.warning(
+                            f"Execution exceeded the write limit of {self.max_written_mb} MB, killing it.."
+                        )
+                        self.cleanup_session()
+                        state = (None, WRITE_LIMIT_EXCEEDED, {}, [], None, None)
+                        exec_time = time.time() - start_time
+                        break
+
                 # child is alive and still executing -> check if we should sigint..
                 if self.timeout is None:
                     continue
@@ -278,36 +1305,54 @@ class Interpreter:
                         logger.warning("Child failed to terminate, killing it..")
                         self.cleanup_session()
 
-                        state = (None, "TimeoutError", {}, [])
+                        state = (None, "TimeoutError", {}, [], None, None)
                         exec_time = self.timeout
                         break
 
-        output: list[str] = []
-        # read all stdout/stderr from child up to the EOF marker
-        # waiting until the queue is empty is not enough since
-        # the feeder thread in child might still be adding to the queue
-        start_collect = time.time()
-        while not self.result_outq.empty() or not output or output[-1] != "<|EOF|>":
-            try:
-                # Add 5-second timeout for output collection
-                if time.time() - start_collect > 5:
-                    logger.warning("Output collection timed out")
-                    break
-                output.append(self.result_outq.get(timeout=1))
-            except queue.Empty:
-                continue
-        output.pop()  # remove the EOF marker
+        # read all stdout/stderr from child up to the EOF marker, which the child writes before reporting
+        # that it's finished. if it was killed, we only wait briefly for what it had written until then
+        # (its own subprocesses might still keep the pipe open)
+        captured = self.output.collect(
+            timeout=EOF_MARKER_TIMEOUT if state[0] is not None else 5
+        )
+        if state[0] is not None and not captured.complete:
+            # e.g. the code redirected fd 1, the output of later executions in this child couldn't be told apart
+            logger.warning(
+                "REPL output ended without an EOF marker, restarting the child"
+            )
+            self.cleanup_session()
+        output = captured.term_out
         logger.info("output of interpreter")
-        logger.info(output)
+        # the full output can be huge (e.g. per-batch training logs), formatting it would slow down the run
+        logger.info(trim_long_string("".join(output)))
 
-        e_cls_name, exc_info, exc_stack = state[1:]
+        e_cls_name, exc_info, exc_stack, resource_usage, profile = state[1:]
+        if resource_usage is not None and prefix_usage is not None:
+            resource_usage = prefix_usage.combine(resource_usage)
+        if resource_usage is not None:
+            logger.info(f"Resource usage: {resource_usage.describe()}")
 
         if e_cls_name == "TimeoutError":
             output.append(
                 f"TimeoutError: Execution exceeded the time limit of {humanize.naturaldelta(self.timeout)}"
             )
+        elif e_cls_name == WRITE_LIMIT_EXCEEDED:
+            output.append(
+                f"{WRITE_LIMIT_EXCEEDED}: Execution was stopped because it wrote more than {self.max_written_mb} MB to disk"
+            )
         else:
             output.append(
                 f"Execution time: {humanize.naturaldelta(exec_time)} seconds (time limit is {humanize.naturaldelta(self.timeout)})."
             )
-        return ExecutionResult(output, exec_time, e_cls_name, exc_info, exc_stack)
+        return ExecutionResult(
+            output,
+            exec_time,
+            e_cls_name,
+            exc_info,
+            exc_stack,
+            out_bytes=captured.num_bytes,
+            out_lines=captured.num_lines,
+            out_file=str(captured.spill_file) if captured.spill_file else None,
+            resource_usage=resource_usage,
+            profile=profile,
+        )
@@ -7,14 +7,17 @@ The journal is the core datastructure in AIDE that contains:
 ...
 """
 
+import heapq
+import threading
 import time
 import uuid
 from dataclasses import dataclass, field
 from typing import Literal, Optional
 
 from dataclasses_json import DataClassJsonMixin
-from .interpreter import ExecutionResult
+from .interpreter import ExecutionResult, ResourceUsage
 from .utils.metric import MetricValue
+from .utils.profiler import ExecutionProfile
 from .utils.response import trim_long_string
 
 
@@ -39,6 +42,15 @@ class Node(DataClassJsonMixin):
     exc_type: str | None = field(default=None, kw_only=True)
     exc_info: dict | None = field(default=None, kw_only=True)
     exc_stack: list[tuple] | None = field(default=None, kw_only=True)
+    # size of the complete output (_term_out only contains its head and tail if it was too long)
+    term_out_bytes: int | None = field(default=None, kw_only=True)
+    term_out_lines: int | None = field(default=None, kw_only=True)
+    # file with the complete (gzip compressed) output, if the interpreter spilled it
+    term_out_file: str | None = field(default=None, kw_only=True)
+    # resources used by the execution (CPU time, peak memory, disk I/O), None if it was killed
+    resource_usage: ResourceUsage | None = field(default=None, kw_only=True)
+    # hot lines and functions of the execution, if the interpreter profiled it
+    profile: ExecutionProfile | None = field(default=None, kw_only=True)
 
     # ---- evaluation ----
     # post-execution result analysis (findings/feedback)
@@ -71,6 +83,11 @@ class Node(DataClassJsonMixin):
         self.exc_type = exec_result.exc_type
         self.exc_info = exec_result.exc_info
         self.exc_stack = exec_result.exc_stack
+        self.term_out_bytes = exec_result.out_bytes
+        self.term_out_lines = exec_result.out_lines
+        self.term_out_file = exec_result.out_file
+        self.resource_usage = exec_result.resource_usage
+        self.profile = exec_result.profile
 
     @property
     def term_out(self) -> str:
@@ -131,6 +148,21 @@ class InteractiveSession(DataClassJsonMixin):
         return "\n".join(trace).strip()
 
 
+class _BestFirst:
+    """Heap key that orders better metric values first (ties keep the order of the nodes)."""
+
+    __slots__ = ("metric",)
+
+    def __init__(self, metric: MetricValue):
+        self.metric = metric
+
+    def __lt__(self, other: "_BestFirst") -> bool:
+        return self.metric > other.metric
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _BestFirst) and self.metric == other.metric
+
+
 @dataclass
 class Journal(DataClassJsonMixin):
     """A collection of nodes representing the solution tree."""
@@ -138,6 +170,22 @@ class Journal(DataClassJsonMixin):
     nodes: list[Node] = field(default_factory=list)
     # eda: InteractiveSession = field(default_factory=lambda: InteractiveSession())
 
+    def __post_init__(self) -> None:
+        # guards the node list and the parent/children links when several workers share the journal
+        self.lock = threading.RLock()
+        # nodes that were appended since the journal was last persisted (nodes aren't changed once they're appended)
+        self._unsaved: list[Node] = []
+        self.rebuild_index()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
     def __getitem__(self, idx: int) -> Node:
         return self.nodes[idx]
 
@@ -145,25 +193,89 @@ class Journal(DataClassJsonMixin):
         """Return the number of nodes in the journal."""
         return len(self.nodes)
 
+    def rebuild_index(self) -> None:
+        """
+        (Re)build the node indexes from scratch, which are otherwise kept up to date incrementally
+        (needed after the tree structure was changed directly, e.g. when loading a journal).
+        """
+        with self.lock:
+            self._drafts: dict[str, Node] = {}
+            self._buggy: dict[str, Node] = {}
+            self._good: dict[str, Node] = {}
+            # max-heaps (lazily invalidated) of all nodes and of the good nodes, ordered by metric
+            self._best_heap: list[tuple] = []
+            self._best_good_heap: list[tuple] = []
+            self._index_versions: dict[str, int] = {}
+            for node in self.nodes:
+                self._index_node(node)
+
+    def _index_node(self, node: Node) -> None:
+        version = self._index_versions.get(node.id, -1) + 1
+        self._index_versions[node.id] = version
+
+        if node.parent is None:
+            self._drafts[node.id] = node
+        if node.is_buggy:
+            self._good.pop(node.id, None)
+            self._buggy[node.id] = node
+        else:
+            self._buggy.pop(node.id, None)
+            self._good[node.id] = node
+
+        if node.metric is not None:
+            entry = (_BestFirst(node.metric), node.step, version, node)
+            heapq.heappush(self._best_heap, entry)
+            if not node.is_buggy:
+                heapq.heappush(self._best_good_heap, entry)
+
+    def _heap_top(self, heap: list[tuple], only_good: bool) -> Node | None:
+        # drop entries of nodes that were updated after they were pushed
+        while heap:
+            _, _, version, node = heap[0]
+            if self._index_versions[node.id] == version and not (
+                only_good and node.is_buggy
+            ):
+                return node
+            heapq.heappop(heap)
+        return None
+
     def append(self, node: Node) -> None:
         """Append a new node to the journal."""
-        node.step = len(self.nodes)
-        self.nodes.append(node)
+        with self.lock:
+            node.step = len(self.nodes)
+            self.nodes.append(node)
+            self._unsaved.append(node)
+            self._index_node(node)
+
+    def pop_unsaved(self) -> list[Node]:
+        """Return the nodes that were appended since the last call."""
+        with self.lock:
+            unsaved = self._unsaved
+            self._unsaved = []
+            return unsaved
 
     @property
     def draft_nodes(self) -> list[Node]:
         """Return a list of nodes representing intial coding drafts"""
-        return [n for n in self.nodes if n.parent is None]
+        return list(self._drafts.values())
 
     @property
     def buggy_nodes(self) -> list[Node]:
         """Return a list of nodes that are considered buggy by the agent."""
-        return [n for n in self.nodes if n.is_buggy]
+        return list(self._buggy.values())
 
     @property
     def good_nodes(self) -> list[Node]:
         """Return a list of nodes that are not considered buggy by the agent."""
-        return [n for n in self.nodes if not n.is_buggy]
+        return list(self._good.values())
+
+    @property
+    def num_drafts(self) -> int:
+        return len(self._drafts)
+
+    @property
+    def num_good(self) -> int:
+        return len(self._good)
 
     def get_metric_history(self) -> list[MetricValue]:
         """Return a list of all metric values in the journal."""
@@ -171,13 +283,10 @@ class Journal(DataClassJsonMixin):
 
     def get_best_node(self, only_good=True) -> None | Node:
         """Return the best solution found so far (node with the highest validation metric)."""
-        if only_good:
-            nodes = self.good_nodes
-            if not nodes:
-                return None
-        else:
-            nodes = self.nodes
-        return max(nodes, key=lambda n: n.metric)
+        with self.lock:
+            if only_good:
+                return self._heap_top(self._best_good_heap, only_good=True)
+            return self._heap_top(self._best_heap, only_good=False)
 
     def generate_summary(self, include_code: bool = False) -> str:
         """Generate a summary of the journal for the agent."""
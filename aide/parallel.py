@@ -0,0 +1,133 @@
+"""
+Parallel and pipelined tree search: runs several agent steps at the same time.
+- drafts, debugs of different buggy leaves and improvements can be generated, executed and reviewed side by side
+- interpreters are only held while code is executing, so LLM generation (and review) of
+  other candidates overlaps with code execution
+- with warm kernels, a child is executed on the interpreter that ran its parent's code if that one is free
+  (on any other interpreter it starts from a fresh kernel)
+"""
+
+import logging
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable
+
+from .agent import Agent
+from .interpreter import Interpreter
+
+logger = logging.getLogger("aide")
+
+
+class ParallelRunner:
+    def __init__(
+        self,
+        agent: Agent,
+        interpreters: list[Interpreter],
+        lookahead: int = 0,
+        on_step: Callable[[], None] | None = None,
+    ):
+        """
+        Runs agent steps concurrently on a pool of interpreters.
+
+        Args:
+            agent (Agent): the agent whose journal is extended by the workers
+            interpreters (list[Interpreter]): pool of interpreters (each with its own working dir)
+            lookahead (int, optional): How many candidates may be generated ahead while all interpreters are busy. Defaults to 0.
+            on_step (Callable[[], None] | None, optional): Called after every finished step while holding the journal lock (e.g. to save the run). Defaults to None.
+        """
+        self.agent = agent
+        self.interpreters = interpreters
+        self.lookahead = lookahead
+        self.on_step = on_step
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._remaining = 0
+        self._free_interpreters: list[Interpreter] = list(interpreters)
+        self._interpreter_freed = threading.Condition()
+
+    def _claim_step(self) -> bool:
+        """Reserve one of the remaining steps for the calling worker."""
+        with self._lock:
+            if self._stop.is_set() or self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def _acquire_interpreter(self, parent_id: str | None) -> Interpreter:
+        """Take a free interpreter, preferably the one whose kernel last ran the code of `parent_id`."""
+        with self._interpreter_freed:
+            self._interpreter_freed.wait_for(lambda: self._free_interpreters)
+            for i, interpreter in enumerate(self._free_interpreters):
+                if parent_id is not None and interpreter.kernel_node_id == parent_id:
+                    return self._free_interpreters.pop(i)
+            return self._free_interpreters.pop(0)
+
+    def _exec_callback(
+        self,
+        code: str,
+        reset_session: bool,
+        parent_id: str | None = None,
+        node_id: str | None = None,
+    ):
+        """Execute code on a free interpreter (and give it back right after execution)."""
+        if self._stop.is_set():
+            raise RuntimeError("The run was stopped")
+        interpreter = self._acquire_interpreter(parent_id)
+        try:
+            return interpreter.run(code, reset_session, parent_id, node_id)
+        finally:
+            with self._interpreter_freed:
+                self._free_interpreters.append(interpreter)
+                self._interpreter_freed.notify()
+
+    def _worker(self) -> None:
+        while self._claim_step():
+            self.agent.step(exec_callback=self._exec_callback)
+            if self.on_step is not None:
+                with self.agent.journal.lock:
+                    self.on_step()
+
+    def run(self, steps: int) -> None:
+        """Run `steps` agent steps, using all workers concurrently."""
+        self._remaining = steps
+        self._stop.clear()
+
+        # the data preview is shared by all workers, so we only generate it once
+        if self.agent.data_preview is None:
+            self.agent.update_data_preview()
+
+        # each worker thread drives one candidate at a time, there are `lookahead` more
+        # threads than interpreters so that new candidates are generated while all interpreters are busy
+        num_workers = len(self.interpreters) + self.lookahead
+        logger.info(
+            f"Running {steps} steps with {len(self.interpreters)} interpreters "
+            f"and {num_workers} workers"
+        )
+        pool = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="aide-worker"
+        )
+        futures = [pool.submit(self._worker) for _ in range(num_workers)]
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        except BaseException:
+            # Ctrl+C
+            self._shutdown(pool)
+            raise
+        failed = [f for f in done if f.exception() is not None]
+        if failed:
+            self._shutdown(pool)
+            # the error of the first failed worker (the others were interrupted by the shutdown)
+            failed[0].result()
+        pool.shutdown()
+
+    def _shutdown(self, pool: ThreadPoolExecutor) -> None:
+        """Stop the workers right away: no new steps, and the in-flight executions are killed."""
+        self._stop.set()
+        for interpreter in self.interpreters:
+            interpreter.interrupt()
+        # workers that are waiting for the LLM still finish their current request
+        pool.shutdown(cancel_futures=True)
+
+    def cleanup(self) -> None:
+        for interpreter in self.interpreters:
+            interpreter.cleanup_session()
@@ -5,10 +5,9 @@ import shutil
 from . import backend
 
 from .agent import Agent
-from .interpreter import Interpreter
 from .journal import Journal, Node
 from .journal2report import journal2report
-from omegaconf import OmegaConf
+from .parallel import ParallelRunner
 from rich.columns import Columns
 from rich.console import Group
 from rich.live import Live
@@ -24,7 +23,15 @@ from rich.progress import (
 from rich.text import Text
 from rich.status import Status
 from rich.tree import Tree
-from .utils.config import load_task_desc, prep_agent_workspace, save_run, load_cfg
+from .utils.config import (
+    create_interpreters,
+    load_task_desc,
+    prep_agent_workspace,
+    prep_worker_workspaces,
+    save_run,
+    load_cfg,
+    setup_llm_cache,
+)
 
 LOG_FORMAT = "%(asctime)s - %(message)s"
 LOG_DATEFMT = "[%X]"
@@ -65,7 +72,9 @@ def journal_to_rich_tree(journal: Journal):
 
         subtree = tree.add(s)
         for child in node.children:
-            append_rec(child, subtree)
+            # skip children that are still being worked on by a parallel worker
+            if child.step is not None:
+                append_rec(child, subtree)
 
     tree = Tree("[bold blue]Solution tree")
     for n in journal.draft_nodes:
@@ -76,16 +85,20 @@ def journal_to_rich_tree(journal: Journal):
 def run():
     cfg = load_cfg()
     logger.info(f'Starting run "{cfg.exp_name}"')
+    setup_llm_cache(cfg)
 
     task_desc = load_task_desc(cfg)
     task_desc_str = backend.compile_prompt_to_md(task_desc)
 
     with Status("Preparing agent workspace (copying and extracting files) ..."):
         prep_agent_workspace(cfg)
+        worker_dirs = prep_worker_workspaces(cfg)
 
     def cleanup():
         if global_step == 0:
             shutil.rmtree(cfg.workspace_dir)
+            if len(worker_dirs) > 1:
+                shutil.rmtree(worker_dirs[1].parent)
 
     atexit.register(cleanup)
 
@@ -95,10 +108,8 @@ def run():
         cfg=cfg,
         journal=journal,
     )
-    interpreter = Interpreter(
-        cfg.workspace_dir,
-        **OmegaConf.to_container(cfg.exec),  # type: ignore
-    )
+    interpreters = create_interpreters(cfg, worker_dirs)
+    interpreter = interpreters[0]
 
     global_step = len(journal)
     prog = Progress(
@@ -143,17 +154,40 @@ def run():
             subtitle="Press [b]Ctrl+C[/b] to stop the run",
         )
 
-    with Live(
-        generate_live(),
-        refresh_per_second=16,
-        screen=True,
-    ) as live:
-        while global_step < cfg.agent.steps:               # this is the loop for each steps
-            agent.step(exec_callback=exec_callback) 
-            save_run(cfg, journal)
-            global_step = len(journal)
-            live.update(generate_live())
-    interpreter.cleanup_session()
+    try:
+        with Live(
+            generate_live(),
+            refresh_per_second=16,
+            screen=True,
+        ) as live:
+            if len(interpreters) > 1 or cfg.agent.pipeline_lookahead > 0:
+
+                def on_step():
+                    nonlocal global_step
+                    save_run(cfg, journal)
+                    global_step = len(journal)
+                    live.update(generate_live())
+
+                status.update(
+                    f"[magenta]Running {len(interpreters)} workers in parallel..."
+                )
+                runner = ParallelRunner(
+                    agent,
+                    interpreters,
+                    lookahead=cfg.agent.pipeline_lookahead,
+                    on_step=on_step,
+                )
+                runner.run(cfg.agent.steps - global_step)
+            while global_step < cfg.agent.steps:               # this is the loop for each steps
+                agent.step(exec_callback=exec_callback) 
+                save_run(cfg, journal)
+                global_step = len(journal)
+                live.update(generate_live())
+    finally:
+        # also on errors and Ctrl+C, so that the journal of the run is kept
+        for interpreter in interpreters:
+            interpreter.cleanup_session()
+        save_run(cfg, journal, final=True)
 
     if cfg.generate_report:
         print("Generating final report from journal...")
@@ -1,12 +1,85 @@
+import bz2
+import gzip
+import hashlib
+import importlib.util
+import json
 import logging
+import lzma
+import os
 import shutil
+import stat
+import tarfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 logger = logging.getLogger("aide")
 
+# ioctl to clone a file as a copy-on-write reflink (from linux/fs.h)
+FICLONE = 0x40049409
 
-def copytree(src: Path, dst: Path, use_symlinks=True):
+# devices (of source files) on which reflinks are not supported
+_no_reflink_devs: set[int] = set()
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Clone `src` to `dst` as a copy-on-write reflink (e.g. on btrfs or xfs), returns False if that's not supported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    src_dev = os.stat(src).st_dev
+    if src_dev in _no_reflink_devs:
+        return False
+    with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+            return True
+        except OSError:
+            _no_reflink_devs.add(src_dev)
+    os.unlink(dst)
+    return False
+
+
+def link_file(src: Path | str, dst: Path | str) -> str:
+    """
+    Materialize `src` at `dst` without copying its contents where possible, `dst` is read-only.
+    Tries a reflink first, then a hardlink (falling back to a copy, e.g. across filesystems).
+    A hardlink shares its inode (and permissions) with `src`, so writes to it would change the original and
+    making it read-only would make the original read-only as well. Hence only sources that are already read-only
+    (e.g. files in the dataset store) are hardlinked. Read-only files don't protect against writes by root,
+    which therefore never gets hardlinks.
+
+    Returns:
+        str: how the file was materialized ("reflink", "hardlink" or "copy")
+    """
+    if _reflink(Path(src), Path(dst)):
+        _make_read_only(dst)
+        return "reflink"
+    try:
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            raise PermissionError("hardlinks are writable by root")
+        if _is_writable(src):
+            raise PermissionError("hardlinks to writable files could change them")
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        shutil.copyfile(src, dst)
+        _make_read_only(dst)
+        return "copy"
+
+
+def _is_writable(f: Path | str) -> bool:
+    mode = stat.S_IMODE(os.stat(f).st_mode)
+    return bool(mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _make_read_only(f: Path | str):
+    mode = stat.S_IMODE(os.stat(f).st_mode)
+    os.chmod(f, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def copytree(src: Path, dst: Path, use_symlinks=True, use_links=False):
     """
     Copy contents of `src` to `dst`. Unlike shutil.copytree, the dst dir can exist and will be merged.
     If src is a file, only that file will be copied. Optionally uses symlinks instead of copying.
@@ -14,8 +87,12 @@ def copytree(src: Path, dst: Path, use_symlinks=True):
     Args:
         src (Path): source directory
         dst (Path): destination directory
+        use_symlinks (bool, optional): Symlink the top-level items of `src` instead of copying them. Defaults to True.
+        use_links (bool, optional): Reflink or hardlink files instead of copying their contents (see `link_file`),
+            the files in `dst` are read-only. Defaults to False.
     """
     assert dst.is_dir()
+    copy_file = link_file if use_links else shutil.copyfile
 
     if src.is_file():
         dest_f = dst / src.name
@@ -23,7 +100,7 @@ def copytree(src: Path, dst: Path, use_symlinks=True):
         if use_symlinks:
             (dest_f).symlink_to(src)
         else:
-            shutil.copyfile(src, dest_f)
+            copy_file(src, dest_f)
         return
 
     for f in src.iterdir():
@@ -32,9 +109,9 @@ def copytree(src: Path, dst: Path, use_symlinks=True):
         if use_symlinks:
             (dest_f).symlink_to(f)
         elif f.is_dir():
-            shutil.copytree(f, dest_f)
+            shutil.copytree(f, dest_f, copy_function=copy_file)
         else:
-            shutil.copyfile(f, dest_f)
+            copy_file(f, dest_f)
 
 
 def clean_up_dataset(path: Path):
@@ -46,55 +123,286 @@ def clean_up_dataset(path: Path):
             item.unlink()
 
 
-def extract_archives(path: Path):
-    """
-    unzips all .zip files within `path` and cleans up task dir
+# archive suffixes (lower case) -> archive kind
+ARCHIVE_SUFFIXES = {
+    ".tar.gz": "tar",
+    ".tgz": "tar",
+    ".tar.bz2": "tar",
+    ".tbz2": "tar",
+    ".tar.xz": "tar",
+    ".txz": "tar",
+    ".tar": "tar",
+    ".zip": "zip",
+    ".7z": "7z",
+    # single compressed files
+    ".gz": "gz",
+    ".bz2": "bz2",
+    ".xz": "xz",
+}
+_open_compressed = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
 
-    [TODO] handle nested zips
-    """
-    for zip_f in path.rglob("*.zip"):
-        f_out_dir = zip_f.with_suffix("")
 
-        # special case: the intended output path already exists (maybe data has already been extracted by user)
-        if f_out_dir.exists():
-            logger.debug(
-                f"Skipping {zip_f} as an item with the same name already exists."
+def _archive_kind(p: Path) -> tuple[str, Path] | None:
+    """Return the kind of archive `p` is and its output path (without the archive suffix), or None."""
+    name = p.name.lower()
+    for suffix, kind in ARCHIVE_SUFFIXES.items():
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return kind, p.with_name(p.name[: -len(suffix)])
+    return None
+
+
+def _extract_archive(archive: Path, kind: str, f_out: Path) -> None:
+    """Extract an archive into the dir `f_out` (or decompress a single file to `f_out`), members are streamed to disk."""
+    if kind in _open_compressed:
+        tmp_f = f_out.with_name(f_out.name + ".__tmp")
+        try:
+            with _open_compressed[kind](archive, "rb") as f_src, open(
+                tmp_f, "wb"
+            ) as f_dst:
+                shutil.copyfileobj(f_src, f_dst, 1024 * 1024)
+        except BaseException:
+            tmp_f.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_f, f_out)
+        return
+
+    f_out.mkdir(exist_ok=True)
+    if kind == "zip":
+        with zipfile.ZipFile(archive, "r") as zip_ref:
+            zip_ref.extractall(f_out)
+    elif kind == "tar":
+        with tarfile.open(archive, "r:*") as tar_ref:
+            if hasattr(tarfile, "data_filter"):
+                # don't extract members outside of f_out (or links to them)
+                tar_ref.extractall(f_out, filter="data")
+            else:
+                tar_ref.extractall(f_out)
+    else:
+        import py7zr
+
+        with py7zr.SevenZipFile(archive, "r") as sz_ref:
+            sz_ref.extractall(f_out)
+
+    # remove any unwanted files
+    clean_up_dataset(f_out)
+
+    contents = list(f_out.iterdir())
+
+    # special case: the archive contains a single dir/file with the same name as the archive
+    if len(contents) == 1 and contents[0].name == f_out.name:
+        sub_item = contents[0]
+        # if it's a dir, move its contents to the parent and remove it
+        if sub_item.is_dir():
+            logger.debug(f"Special handling (child is dir) enabled for: {archive}")
+            # rename the child first, in case it contains an item with its own name
+            sub_item = sub_item.rename(f_out / ".__tmp_rename")
+            for f in sub_item.iterdir():
+                os.replace(f, f_out / f.name)
+            sub_item.rmdir()
+        # if it's a file, rename it to the parent and remove the parent
+        elif sub_item.is_file():
+            logger.debug(f"Special handling (child is file) enabled for: {archive}")
+            # unique per archive (archives are extracted in parallel, e.g. train.csv.zip and train.json.zip)
+            sub_item_tmp = sub_item.rename(
+                f_out.with_name(f_out.name + ".__tmp_rename")
             )
-            # if it's a file, it's probably exactly the same as in the zip -> remove the zip
-            # [TODO] maybe add an extra check to see if zip file content matches the colliding file
-            if f_out_dir.is_file() and f_out_dir.suffix != "":
-                zip_f.unlink()
-            continue
+            f_out.rmdir()
+            sub_item_tmp.rename(f_out)
+
+
+def extract_archives(path: Path, max_workers: int | None = None):
+    """
+    Extract all archives (zip, tar, tar.gz/bz2/xz, gz/bz2/xz compressed files and 7z if py7zr is installed)
+    within `path` and clean up the task dir.
+    Archives are extracted in parallel on `max_workers` threads (defaults to the number of CPUs), with their members
+    streamed to disk. Archives within the extracted contents (nested archives) are extracted as well.
+    """
+    # archives that are left in place (e.g. because their output path already exists)
+    skipped: set[Path] = set()
+    while True:
+        archives: dict[Path, tuple[Path, str]] = {}
+        for archive in sorted(path.rglob("*")):
+            if archive in skipped or not archive.is_file():
+                continue
+            kind_out = _archive_kind(archive)
+            if kind_out is None:
+                continue
+            kind, f_out = kind_out
+
+            if kind == "7z" and importlib.util.find_spec("py7zr") is None:
+                logger.warning(f"Skipping {archive}, py7zr is required to extract it.")
+                skipped.add(archive)
+                continue
+
+            # special case: the intended output path already exists (maybe data has already been extracted by user)
+            if f_out.exists():
+                logger.debug(
+                    f"Skipping {archive} as an item with the same name already exists."
+                )
+                # if it's a file, it's probably exactly the same as in the archive -> remove the archive
+                # [TODO] maybe add an extra check to see if archive content matches the colliding file
+                if f_out.is_file() and f_out.suffix != "":
+                    archive.unlink()
+                else:
+                    skipped.add(archive)
+                continue
+
+            # several archives with the same output path (e.g. x.zip and x.tar) are extracted in separate rounds
+            if f_out not in archives:
+                archives[f_out] = (archive, kind)
 
-        logger.debug(f"Extracting: {zip_f}")
-        f_out_dir.mkdir(exist_ok=True)
-        with zipfile.ZipFile(zip_f, "r") as zip_ref:
-            zip_ref.extractall(f_out_dir)
+        if not archives:
+            return
 
-        # remove any unwanted files
-        clean_up_dataset(f_out_dir)
+        def extract(f_out: Path) -> None:
+            archive, kind = archives[f_out]
+            logger.debug(f"Extracting: {archive}")
+            try:
+                _extract_archive(archive, kind, f_out)
+            except Exception as e:
+                logger.warning(f"Could not extract {archive}: {e}")
+                skipped.add(archive)
+                if f_out.is_dir():
+                    shutil.rmtree(f_out)
+                return
+            archive.unlink()
 
-        contents = list(f_out_dir.iterdir())
+        num_workers = min(max_workers or os.cpu_count() or 1, len(archives))
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            list(pool.map(extract, archives))
 
-        # special case: the zip contains a single dir/file with the same name as the zip
-        if len(contents) == 1 and contents[0].name == f_out_dir.name:
-            sub_item = contents[0]
-            # if it's a dir, move its contents to the parent and remove it
-            if sub_item.is_dir():
-                logger.debug(f"Special handling (child is dir) enabled for: {zip_f}")
-                for f in sub_item.rglob("*"):
-                    shutil.move(f, f_out_dir)
-                sub_item.rmdir()
-            # if it's a file, rename it to the parent and remove the parent
-            elif sub_item.is_file():
-                logger.debug(f"Special handling (child is file) enabled for: {zip_f}")
-                sub_item_tmp = sub_item.rename(f_out_dir.with_suffix(".__tmp_rename"))
-                f_out_dir.rmdir()
-                sub_item_tmp.rename(f_out_dir)
 
-        zip_f.unlink()
+def convert_csv_files(path: Path, fmt: str):
+    """
+    Write a columnar copy (`fmt` is "parquet" or "feather") next to each .csv file within `path`,
+    which the generated code can load much faster. The files are converted in a streaming fashion (bounded memory).
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    for csv_f in path.rglob("*.csv"):
+        out_f = csv_f.with_suffix(f".{fmt}")
+        # don't write into the original data dir through symlinked directories
+        if out_f.exists() or not csv_f.parent.resolve().is_relative_to(path.resolve()):
+            continue
+        logger.debug(f"Converting {csv_f} to {fmt}")
+        tmp_f = out_f.with_name(out_f.name + ".__tmp")
+        try:
+            # like pandas, treat empty strings as missing values
+            convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+            with pa_csv.open_csv(csv_f, convert_options=convert_options) as reader:
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(tmp_f, reader.schema)
+                else:
+                    writer = pa.ipc.new_file(tmp_f, reader.schema)
+                with writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+        except pa.ArrowInvalid as e:
+            # e.g. the column types inferred from the first block don't fit later rows
+            logger.warning(f"Could not convert {csv_f} to {fmt}: {e}")
+            tmp_f.unlink(missing_ok=True)
+            continue
+        tmp_f.rename(out_f)
 
 
-def preproc_data(path: Path):
+def preproc_data(path: Path, convert_csv: str | None = None):
     extract_archives(path)
     clean_up_dataset(path)
+    if convert_csv is not None:
+        convert_csv_files(path, convert_csv)
+
+
+# bump to invalidate all datasets in the store (e.g. if preprocessing changes)
+DATASET_STORE_VERSION = 1
+
+
+def dataset_fingerprint(
+    data_dir: Path, hash_cache_dir: Path | None = None, **options
+) -> str:
+    """
+    Fingerprint of the contents of `data_dir` (file names and full content hashes, see `content_hash`)
+    and of the preprocessing `options`. The hashes of unchanged files are reused from `hash_cache_dir`.
+    """
+    from .data_preview import content_hash
+
+    h = hashlib.sha256(
+        json.dumps([DATASET_STORE_VERSION, options], sort_keys=True).encode()
+    )
+    if data_dir.is_file():
+        files = [data_dir]
+        root = data_dir.parent
+    else:
+        files = sorted(
+            Path(dirpath) / name
+            for dirpath, _, names in os.walk(data_dir, followlinks=True)
+            for name in names
+        )
+        root = data_dir
+    for f in files:
+        h.update(f"{f.relative_to(root)}\0{content_hash(f, hash_cache_dir)}\0".encode())
+    return h.hexdigest()
+
+
+def _make_tree_read_only(path: Path):
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            f = os.path.join(dirpath, name)
+            # hardlinks share their permissions with files outside the tree (and are read-only already)
+            if not os.path.islink(f) and os.stat(f).st_nlink == 1:
+                _make_read_only(f)
+
+
+def prepare_dataset(
+    data_dir: Path,
+    store_dir: Path,
+    preprocess=True,
+    convert_csv: str | None = None,
+    use_links=True,
+) -> Path:
+    """
+    Return the prepared (copied and preprocessed) version of `data_dir` from a dataset store shared by all experiments.
+    Datasets are stored in `store_dir/<fingerprint>` (see `dataset_fingerprint`), each version of a dataset
+    is only prepared once (under a lock, so concurrent experiments wait for each other) and the files in the store are read-only.
+
+    Args:
+        data_dir (Path): the original data
+        store_dir (Path): directory of the dataset store (created if it doesn't exist)
+        preprocess (bool, optional): Whether to preprocess the data (see `preproc_data`). Defaults to True.
+        convert_csv (str | None, optional): see `preproc_data`. Defaults to None.
+        use_links (bool, optional): Reflink or hardlink the original files into the store (see `link_file`). Defaults to True.
+    """
+    import fcntl
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    fp = dataset_fingerprint(
+        data_dir,
+        hash_cache_dir=store_dir / "hashes",
+        preprocess=preprocess,
+        convert_csv=convert_csv,
+    )
+    dataset_dir = store_dir / fp
+    if dataset_dir.exists():
+        logger.info(f"Using prepared dataset {fp[:12]} from {store_dir}")
+        return dataset_dir
+
+    with open(store_dir / f"{fp}.lock", "w") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        # another experiment may have prepared the dataset while we were waiting for the lock
+        if dataset_dir.exists():
+            logger.info(f"Using prepared dataset {fp[:12]} from {store_dir}")
+            return dataset_dir
+
+        logger.info(f"Preparing dataset {fp[:12]} in {store_dir}")
+        # the dataset is prepared in a temporary dir (left over if a previous attempt failed) and renamed when done
+        tmp_dir = store_dir / f"{fp}.__tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+        copytree(data_dir, tmp_dir, use_symlinks=False, use_links=use_links)
+        if preprocess:
+            preproc_data(tmp_dir, convert_csv=convert_csv)
+        _make_tree_read_only(tmp_dir)
+        os.rename(tmp_dir, dataset_dir)
+    return dataset_dir
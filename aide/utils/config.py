@@ -1,5 +1,6 @@
 """configuration and setup utils"""
 
+import time
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Hashable, cast
@@ -13,7 +14,9 @@ from rich.logging import RichHandler
 import logging
 
 from . import tree_export
-from . import copytree, preproc_data, serialize
+from .. import backend
+from ..interpreter import Interpreter, partition_cpus
+from . import copytree, prepare_dataset, preproc_data, serialize
 
 shutup.mute_warnings()
 logging.basicConfig(
@@ -49,6 +52,10 @@ class AgentConfig:
     k_fold_validation: int
     expose_prediction: bool
     data_preview: bool
+    data_preview_cache: bool
+    parallel_workers: int
+    pipeline_lookahead: int
+    cpu_partition: bool
 
     code: StageConfig
     feedback: StageConfig
@@ -61,6 +68,34 @@ class ExecConfig:
     timeout: int
     agent_file_name: str
     format_tb_ipython: bool
+    fork_server: bool
+    preload_modules: list[str]
+    adaptive_preload: bool
+    output_head_bytes: int
+    output_tail_bytes: int
+    spill_output: bool
+    loader_cache: bool
+    loader_cache_max_mb: int
+    shared_tables: list[str]
+    warm_kernel: bool
+    warm_kernel_max_memory_mb: int
+    snapshots: bool
+    max_snapshots: int
+    max_memory_mb: int | None
+    max_cpu_seconds: int | None
+    max_open_files: int | None
+    max_single_file_mb: int | None
+    max_written_mb: int | None
+    profile: bool
+    profile_interval: float
+    profile_top_n: int
+
+
+@dataclass
+class LLMCacheConfig:
+    enabled: bool
+    replay: bool
+    max_size_mb: int
 
 
 @dataclass
@@ -73,13 +108,18 @@ class Config(Hashable):
 
     log_dir: Path
     workspace_dir: Path
+    cache_dir: Path
 
     preprocess_data: bool
+    convert_csv: str | None
     copy_data: bool
+    link_data: bool
+    dataset_store: bool
 
     exp_name: str
 
     exec: ExecConfig
+    llm_cache: LLMCacheConfig
     generate_report: bool
     report: StageConfig
     agent: AgentConfig
@@ -120,6 +160,9 @@ def prep_cfg(cfg: Config):
             "You must provide either a description of the task goal (`goal=...`) or a path to a plaintext file containing the description (`desc_file=...`)."
         )
 
+    if cfg.convert_csv not in (None, "parquet", "feather"):
+        raise ValueError('`convert_csv` must be one of null, "parquet" or "feather".')
+
     if cfg.data_dir.startswith("example_tasks/"):
         cfg.data_dir = Path(__file__).parent.parent / cfg.data_dir
     cfg.data_dir = Path(cfg.data_dir).resolve()
@@ -133,6 +176,8 @@ def prep_cfg(cfg: Config):
     top_workspace_dir = Path(cfg.workspace_dir).resolve()
     top_workspace_dir.mkdir(parents=True, exist_ok=True)
 
+    cfg.cache_dir = Path(cfg.cache_dir).resolve()
+
     # generate experiment name and prefix with consecutive index
     ind = max(_get_next_logindex(top_log_dir), _get_next_logindex(top_workspace_dir))
     cfg.exp_name = cfg.exp_name or coolname.generate_slug(3)
@@ -178,25 +223,113 @@ def load_task_desc(cfg: Config):
     return task_desc
 
 
+def setup_llm_cache(cfg: Config):
+    """Enable the on-disk LLM response cache if configured."""
+    if cfg.llm_cache.enabled or cfg.llm_cache.replay:
+        backend.cache.configure(
+            cfg.cache_dir / "llm_cache.sqlite",
+            max_size_mb=cfg.llm_cache.max_size_mb,
+            replay=cfg.llm_cache.replay,
+        )
+
+
 def prep_agent_workspace(cfg: Config):
     """Setup the agent's workspace and preprocess data if necessary."""
     (cfg.workspace_dir / "input").mkdir(parents=True, exist_ok=True)
     (cfg.workspace_dir / "working").mkdir(parents=True, exist_ok=True)
 
-    copytree(cfg.data_dir, cfg.workspace_dir / "input", use_symlinks=not cfg.copy_data)
+    if cfg.copy_data and cfg.dataset_store:
+        dataset_dir = prepare_dataset(
+            cfg.data_dir,
+            cfg.cache_dir / "datasets",
+            preprocess=cfg.preprocess_data,
+            convert_csv=cfg.convert_csv,
+            use_links=cfg.link_data,
+        )
+        copytree(
+            dataset_dir,
+            cfg.workspace_dir / "input",
+            use_symlinks=False,
+            use_links=cfg.link_data,
+        )
+        return
+
+    copytree(
+        cfg.data_dir,
+        cfg.workspace_dir / "input",
+        use_symlinks=not cfg.copy_data,
+        use_links=cfg.link_data,
+    )
     if cfg.preprocess_data:
-        preproc_data(cfg.workspace_dir / "input")
+        preproc_data(cfg.workspace_dir / "input", convert_csv=cfg.convert_csv)
+
+
+def prep_worker_workspaces(cfg: Config) -> list[Path]:
+    """
+    Setup one working directory per parallel worker.
+    The first worker uses the agent workspace, the others get their own `working` dir
+    next to it and share the (already prepared) input data via a symlink.
+    """
+    worker_dirs = [cfg.workspace_dir]
+    for i in range(1, cfg.agent.parallel_workers):
+        worker_dir = cfg.workspace_dir.parent / f"{cfg.exp_name}-workers" / str(i)
+        (worker_dir / "working").mkdir(parents=True, exist_ok=True)
+        if not (worker_dir / "input").exists():
+            (worker_dir / "input").symlink_to(
+                cfg.workspace_dir / "input", target_is_directory=True
+            )
+        worker_dirs.append(worker_dir)
+    return worker_dirs
+
+
+def create_interpreters(cfg: Config, worker_dirs: list[Path]) -> list[Interpreter]:
+    """Create one interpreter per parallel worker (see `prep_worker_workspaces`)."""
+    # one slice of the CPU cores per worker (so parallel executions don't oversubscribe them)
+    cpu_slices = (
+        partition_cpus(len(worker_dirs))
+        if cfg.agent.cpu_partition
+        else [None] * len(worker_dirs)
+    )
+    return [
+        Interpreter(
+            worker_dir,
+            **OmegaConf.to_container(cfg.exec),  # type: ignore
+            loader_cache_dir=cfg.cache_dir / "loaders",
+            shared_data_dir=cfg.cache_dir / "shared_tables",
+            cpu_cores=cores,
+        )
+        for worker_dir, cores in zip(worker_dirs, cpu_slices)
+    ]
+
+
+# while a run is in progress, the tree visualization (whose rendering takes time linear in the size of
+# the journal) is regenerated at most this often (in seconds)
+TREE_EXPORT_INTERVAL = 30.0
+# log dir -> time of the last tree export
+_last_tree_export: dict[Path, float] = {}
 
 
-def save_run(cfg: Config, journal):
+def save_run(cfg: Config, journal, final: bool = False):
     cfg.log_dir.mkdir(parents=True, exist_ok=True)
 
-    # save journal
-    serialize.dump_json(journal, cfg.log_dir / "journal.json")
+    # save journal: append new nodes to the journal log (it can be loaded with `serialize.load_journal_log`),
+    # the full journal is only written at the end (callers also do the final save if the run is interrupted)
+    if final:
+        serialize.compact_journal_log(journal, cfg.log_dir / "journal.jsonl")
+        serialize.dump_json(journal, cfg.log_dir / "journal.json")
+    else:
+        serialize.append_journal_log(journal, cfg.log_dir / "journal.jsonl")
     # save config
     OmegaConf.save(config=cfg, f=cfg.log_dir / "config.yaml")
+    if len(journal) == 0:
+        # e.g. the run was interrupted during the first step
+        return
     # create the tree + code visualization
-    tree_export.generate(cfg, journal, cfg.log_dir / "tree_plot.html")
+    now = time.monotonic()
+    last_export = _last_tree_export.get(cfg.log_dir)
+    if final or last_export is None or now - last_export >= TREE_EXPORT_INTERVAL:
+        tree_export.generate(cfg, journal, cfg.log_dir / "tree_plot.html")
+        _last_tree_export[cfg.log_dir] = now
     # save the best found solution
     best_node = journal.get_best_node(only_good=False)
     with open(cfg.log_dir / "best_solution.py", "w") as f:
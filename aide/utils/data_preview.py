@@ -1,19 +1,221 @@
 """
 Contains functions to manually generate a textual preview of some common file types (.csv, .json,..) for the agent.
+Each file is profiled once into a structured summary, which is rendered at the level of detail that fits the preview's budget.
+Summaries (and line counts) of individual files can be cached on disk, keyed on a fingerprint of the file contents,
+so that they are shared by all experiments on the same data.
+`content_hash` is the exact counterpart of the fingerprint, for caches of data that must match the file exactly.
 """
 
+import csv
+import hashlib
+import heapq
 import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Any, Callable, cast
 
 import humanize
+import numpy as np
 import pandas as pd
 from genson import SchemaBuilder
-from pandas.api.types import is_numeric_dtype
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+logger = logging.getLogger("aide")
 
 # these files are treated as code (e.g. markdown wrapped)
 code_files = {".py", ".sh", ".yaml", ".yml", ".md", ".html", ".xml", ".log", ".rst"}
 # we treat these files as text (rather than binary) files
 plaintext_files = {".txt", ".csv", ".json", ".tsv"} | code_files
+# columnar formats, previewed from their metadata only (requires pyarrow)
+columnar_files = {".parquet", ".feather", ".arrow"}
+
+# files up to this size are hashed completely, larger files only in sampled blocks
+FULL_HASH_MAX_SIZE = 64 * 1024 * 1024
+HASH_SAMPLE_BLOCKS = 16
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_fingerprint(p: Path, size: int | None = None) -> str:
+    """
+    Compute a fingerprint of the contents of a file. Large files are only hashed in evenly spaced blocks
+    (together with their size), so fingerprinting multi-GB files takes milliseconds.
+    """
+    size = p.stat().st_size if size is None else size
+    h = hashlib.sha256(str(size).encode())
+    with open(p, "rb") as f:
+        if size <= FULL_HASH_MAX_SIZE:
+            while chunk := f.read(HASH_BLOCK_SIZE):
+                h.update(chunk)
+        else:
+            step = (size - HASH_BLOCK_SIZE) // (HASH_SAMPLE_BLOCKS - 1)
+            for i in range(HASH_SAMPLE_BLOCKS):
+                f.seek(i * step)
+                h.update(f.read(HASH_BLOCK_SIZE))
+    return h.hexdigest()
+
+
+# (path, device, inode, size, mtime) -> full content hash, for files that are hashed repeatedly by the same process
+_content_hashes: dict[tuple, str] = {}
+
+
+def content_hash(p: Path, cache_dir: Path | None = None) -> str:
+    """
+    Compute a hash of the complete contents of a file, for caches whose results must match the file exactly
+    (unlike `content_fingerprint`, which only samples large files). A file is only hashed again once its
+    device, inode, size or mtime change, the hashes are remembered in memory and, if `cache_dir` is given, on disk.
+    """
+    st = os.stat(p)
+    stat_key = (os.path.realpath(p), st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    if stat_key in _content_hashes:
+        return _content_hashes[stat_key]
+
+    cache_f = None
+    if cache_dir is not None:
+        key = hashlib.sha256(repr(stat_key).encode()).hexdigest()
+        cache_f = Path(cache_dir) / f"{key}.sha256"
+        try:
+            _content_hashes[stat_key] = cache_f.read_text()
+            return _content_hashes[stat_key]
+        except OSError:
+            pass
+
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        while chunk := f.read(HASH_BLOCK_SIZE):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if cache_f is not None:
+        cache_f.parent.mkdir(parents=True, exist_ok=True)
+        tmp_f = cache_f.with_name(f"{cache_f.name}.{os.getpid()}.tmp")
+        tmp_f.write_text(digest)
+        os.replace(tmp_f, cache_f)
+    _content_hashes[stat_key] = digest
+    return digest
+
+
+def _write_json_atomic(path: Path, obj: Any) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+class PreviewCache:
+    def __init__(self, cache_dir: Path):
+        """
+        Persistent cache of per-file preview results, shared across experiments.
+        Results are stored per content fingerprint, a stat index (path, size, mtime -> fingerprint)
+        avoids re-hashing files that haven't changed.
+
+        Args:
+            cache_dir (Path): directory of the cache (created if it doesn't exist)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._stat_index_path = self.cache_dir / "stat_index.json"
+        self._stat_index: dict[str, list] = {}
+        if self._stat_index_path.exists():
+            try:
+                with open(self._stat_index_path) as f:
+                    self._stat_index = json.load(f)
+            except json.JSONDecodeError:
+                pass
+        self._stat_index_changed = False
+
+    def fingerprint(self, p: Path) -> str:
+        st = p.stat()
+        key = str(p.resolve())
+        entry = self._stat_index.get(key)
+        if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+            return entry[2]
+        fp = content_fingerprint(p, st.st_size)
+        self._stat_index[key] = [st.st_size, st.st_mtime_ns, fp]
+        self._stat_index_changed = True
+        return fp
+
+    def _load_entry(self, p: Path) -> tuple[Path, dict]:
+        entry_path = self.cache_dir / f"{self.fingerprint(p)}.json"
+        if entry_path.exists():
+            try:
+                with open(entry_path) as f:
+                    return entry_path, json.load(f)
+            except json.JSONDecodeError:
+                pass
+        return entry_path, {}
+
+    def get(self, p: Path, key: str) -> Any | None:
+        """Return the cached result `key` for file `p` (or None)."""
+        return self._load_entry(p)[1].get(key)
+
+    def put(self, p: Path, key: str, value: Any) -> None:
+        entry_path, entry = self._load_entry(p)
+        entry[key] = value
+        _write_json_atomic(entry_path, entry)
+
+    def get_or_compute(self, p: Path, key: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached result `key` for file `p`, or compute (and cache) it."""
+        value = self.get(p, key)
+        if value is None:
+            value = compute()
+            self.put(p, key, value)
+        return value
+
+    def save(self) -> None:
+        if self._stat_index_changed:
+            _write_json_atomic(self._stat_index_path, self._stat_index)
+            self._stat_index_changed = False
+
+
+def _cached(
+    cache: PreviewCache | None, p: Path, key: str, compute: Callable[[], Any]
+) -> Any:
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(p, key, compute)
+
+
+# line counts of larger files are estimated from a sample of their contents
+LINE_COUNT_MAX_SIZE = 256 * 1024 * 1024
+LINE_COUNT_BLOCK_SIZE = 1024 * 1024
+
+
+def count_lines(f: Path) -> tuple[int, bool]:
+    """
+    Count the lines of a file (like iterating over it in text mode) by counting newlines in large binary blocks.
+    Files above LINE_COUNT_MAX_SIZE are not read completely, their line count is estimated
+    from the average line length in evenly spaced blocks.
+
+    Returns:
+        tuple[int, bool]: the number of lines and whether it is an estimate
+    """
+    size = f.stat().st_size
+    with open(f, "rb") as fh:
+        if size > LINE_COUNT_MAX_SIZE:
+            num_blocks = HASH_SAMPLE_BLOCKS
+            step = (size - LINE_COUNT_BLOCK_SIZE) // (num_blocks - 1)
+            newlines = 0
+            for i in range(num_blocks):
+                fh.seek(i * step)
+                newlines += fh.read(LINE_COUNT_BLOCK_SIZE).count(b"\n")
+            bytes_per_line = num_blocks * LINE_COUNT_BLOCK_SIZE / max(newlines, 1)
+            return round(size / bytes_per_line), True
+
+        num_lines = 0
+        last_block = b""
+        while block := fh.read(LINE_COUNT_BLOCK_SIZE):
+            num_lines += block.count(b"\n")
+            last_block = block
+    # an unterminated last line counts as well
+    if last_block and not last_block.endswith(b"\n"):
+        num_lines += 1
+    return num_lines, False
 
 
 def get_file_len_size(f: Path) -> tuple[int, str]:
@@ -22,38 +224,580 @@ def get_file_len_size(f: Path) -> tuple[int, str]:
     Also returns a human-readable string representation of the size.
     """
     if f.suffix in plaintext_files:
-        num_lines = sum(1 for _ in open(f))
+        num_lines, estimated = count_lines(f)
+        if estimated:
+            size_str = humanize.naturalsize(f.stat().st_size)
+            return num_lines, f"~{num_lines} lines, {size_str}"
         return num_lines, f"{num_lines} lines"
     else:
         s = f.stat().st_size
         return s, humanize.naturalsize(s)
 
 
-def file_tree(path: Path, depth=0) -> str:
+def _scan_dir(path: Path, max_files: int) -> tuple[list[Path], int, list[Path]]:
+    """
+    List a directory in a single pass without stat'ing or sorting all of its files.
+
+    Returns:
+        tuple[list[Path], int, list[Path]]: the first `max_files` files (sorted by name), the total number of files and all subdirectories (sorted)
+    """
+    file_names: list[str] = []
+    num_files = 0
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                dirs.append(Path(entry.path))
+                continue
+            num_files += 1
+            # keep the `max_files` smallest names in a (max-)heap
+            if len(file_names) < max_files:
+                heapq.heappush(file_names, _ReversedStr(entry.name))
+            elif entry.name < file_names[0]:
+                heapq.heapreplace(file_names, _ReversedStr(entry.name))
+    files = [Path(path) / name for name in sorted(map(str, file_names))]
+    return files, num_files, sorted(dirs)
+
+
+class _ReversedStr(str):
+    """String with a reversed ordering (to use heapq as a max-heap)."""
+
+    def __lt__(self, other: str) -> bool:
+        return str.__gt__(self, other)
+
+
+def file_tree(path: Path, depth=0, cache: PreviewCache | None = None) -> str:
     """Generate a tree structure of files in a directory"""
     result = []
-    files = [p for p in Path(path).iterdir() if not p.is_dir()]
-    dirs = [p for p in Path(path).iterdir() if p.is_dir()]
-    max_n = 4 if len(files) > 30 else 8
-    for p in sorted(files)[:max_n]:
-        result.append(f"{' ' * depth * 4}{p.name} ({get_file_len_size(p)[1]})")
-    if len(files) > max_n:
-        result.append(f"{' ' * depth * 4}... and {len(files) - max_n} other files")
-
-    for p in sorted(dirs):
+    files, num_files, dirs = _scan_dir(path, max_files=8)
+    max_n = 4 if num_files > 30 else 8
+    for p in files[:max_n]:
+        size_str = _cached(cache, p, "len_size", lambda: get_file_len_size(p))[1]
+        result.append(f"{' ' * depth * 4}{p.name} ({size_str})")
+    if num_files > max_n:
+        result.append(f"{' ' * depth * 4}... and {num_files - max_n} other files")
+
+    for p in dirs:
         result.append(f"{' ' * depth * 4}{p.name}/")
-        result.append(file_tree(p, depth + 1))
+        result.append(file_tree(p, depth + 1, cache=cache))
 
     return "\n".join(result)
 
 
 def _walk(path: Path):
     """Recursively walk a directory (analogous to os.walk but for pathlib.Path)"""
-    for p in sorted(Path(path).iterdir()):
-        if p.is_dir():
-            yield from _walk(p)
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir():
+            yield from _walk(Path(entry.path))
+            continue
+        yield Path(entry.path)
+
+
+# number of smallest column value hashes kept to estimate the number of distinct values (exact below this)
+DISTINCT_SKETCH_SIZE = 4096
+# number of (approximately) most frequent values tracked per column
+TOP_VALUES_CAPACITY = 2048
+# approximate amount of CSV text parsed at once when profiling
+CSV_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class ColumnProfile:
+    """
+    Summary statistics of a table column (csv columns are profiled in a single streaming pass,
+    columns of parquet/feather files only from the statistics in their metadata).
+    """
+
+    name: str
+    dtype: str
+    nan_count: int | None
+    # number of distinct non-null values (estimated if there are more than DISTINCT_SKETCH_SIZE), None if unknown
+    num_unique: int | None
+    # unique values in order of appearance (incl. nan, like `Series.unique`), only if there are at most 10
+    unique_values: list | None = None
+    min: Any = None
+    max: Any = None
+    # share of True values (for boolean columns)
+    true_frac: float | None = None
+    # (approximately) most frequent values (for object columns)
+    top_values: list = field(default_factory=list)
+
+
+@dataclass
+class TableProfile:
+    num_rows: int
+    columns: list[ColumnProfile]
+    # storage format details (e.g. number of parquet row groups)
+    format: str | None = None
+
+
+@dataclass
+class FileSummary:
+    """
+    Structured summary of a file, computed (and cached) once and rendered at different levels of detail
+    so that the data preview fits into its budget.
+    """
+
+    # "table" (csv, parquet, feather), "json" (json schema), "text" (content of a short plaintext file)
+    # or "note" (a fixed description, e.g. if profiling took too long)
+    kind: str
+    table: TableProfile | None = None
+    text: str | None = None
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FileSummary":
+        table = d.get("table")
+        if table is not None:
+            table = TableProfile(
+                num_rows=table["num_rows"],
+                columns=[ColumnProfile(**c) for c in table["columns"]],
+                format=table.get("format"),
+            )
+        return cls(kind=d["kind"], table=table, text=d.get("text"))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _merge_dtypes(a: np.dtype | None, b: np.dtype) -> np.dtype:
+    """Dtype of a column if it was read at once, given the dtypes of two chunks of it."""
+    if a is None or a == b:
+        return b
+    if (
+        is_numeric_dtype(a)
+        and is_numeric_dtype(b)
+        and not (is_bool_dtype(a) or is_bool_dtype(b))
+    ):
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+class _ColumnStats:
+    """Streaming accumulator for the statistics of one csv column."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.dtype: np.dtype | None = None
+        self.nan_count = 0
+        self.true_count = 0
+        self.non_null_count = 0
+        self.min: float | None = None
+        self.max: float | None = None
+        self.unique_values: list | None = []
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.value_counts: Counter = Counter()
+
+    def update(self, col: pd.Series, detailed: bool) -> None:
+        self.dtype = _merge_dtypes(self.dtype, col.dtype)
+        if not detailed:
+            return
+        nulls = col.isnull()
+        self.nan_count += int(nulls.sum())
+        non_null = col[~nulls]
+        self.non_null_count += len(non_null)
+
+        if is_bool_dtype(col.dtype):
+            self.true_count += int(non_null.sum())
+        elif is_numeric_dtype(col.dtype) and len(non_null):
+            col_min, col_max = float(non_null.min()), float(non_null.max())
+            self.min = col_min if self.min is None else min(self.min, col_min)
+            self.max = col_max if self.max is None else max(self.max, col_max)
+        elif col.dtype == object:
+            self.value_counts.update(non_null.value_counts().to_dict())
+            if len(self.value_counts) > TOP_VALUES_CAPACITY:
+                # keep the most frequent values only (heavy hitters stay in the counter)
+                self.value_counts = Counter(
+                    dict(self.value_counts.most_common(TOP_VALUES_CAPACITY // 2))
+                )
+
+        # unique values in order of appearance, as long as there are only a few
+        if self.unique_values is not None:
+            for v in col.unique().tolist():
+                if not any(_same_value(v, u) for u in self.unique_values):
+                    self.unique_values.append(v)
+                    if len(self.unique_values) > 10:
+                        self.unique_values = None
+                        break
+
+        # keep the smallest hashes of the distinct values (k minimum values sketch)
+        if is_numeric_dtype(non_null.dtype) and not is_bool_dtype(non_null.dtype):
+            # hash integers and floats consistently (1 and 1.0 are the same value)
+            non_null = non_null.astype(np.float64)
+        hashes = pd.util.hash_pandas_object(non_null, index=False).to_numpy()
+        self.hashes = np.union1d(self.hashes, hashes)[:DISTINCT_SKETCH_SIZE]
+
+    def finish(self) -> ColumnProfile:
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            num_unique = len(self.hashes)
+        else:
+            kth = float(self.hashes[DISTINCT_SKETCH_SIZE - 1]) / 2.0**64
+            num_unique = int((DISTINCT_SKETCH_SIZE - 1) / kth)
+        dtype = self.dtype if self.dtype is not None else np.dtype(object)
+        return ColumnProfile(
+            name=self.name,
+            dtype=str(dtype),
+            nan_count=self.nan_count,
+            num_unique=num_unique,
+            unique_values=self.unique_values,
+            min=self.min,
+            max=self.max,
+            true_frac=(
+                self.true_count / self.non_null_count if self.non_null_count else None
+            ),
+            top_values=[v for v, _ in self.value_counts.most_common(4)],
+        )
+
+
+def _same_value(a, b) -> bool:
+    return a == b or (pd.isna(a) is True and pd.isna(b) is True)
+
+
+def _csv_chunk_rows(p: Path) -> int:
+    """Estimate how many rows make up about CSV_CHUNK_BYTES of the file."""
+    with open(p, "rb") as f:
+        sample = f.read(1024 * 1024)
+    bytes_per_row = len(sample) / max(sample.count(b"\n"), 1)
+    return max(1000, int(CSV_CHUNK_BYTES / bytes_per_row))
+
+
+def profile_csv(p: Path, detailed=True) -> TableProfile:
+    """
+    Profile a csv file in a single pass over chunks of it, so memory stays bounded even for huge files.
+    Row and nan counts, ranges and dtypes are exact, the number of unique values is estimated
+    for high-cardinality columns and the most frequent values are approximate.
+
+    Args:
+        p (Path): the path to the csv file
+        detailed (bool, optional): whether to compute the column statistics (otherwise only rows and columns are counted). Defaults to True.
+    """
+    num_rows = 0
+    stats: list[_ColumnStats] | None = None
+    with pd.read_csv(p, chunksize=_csv_chunk_rows(p)) as reader:
+        for chunk in reader:
+            if stats is None:
+                stats = [_ColumnStats(str(c)) for c in chunk.columns]
+            num_rows += len(chunk)
+            for col_stats, (_, col) in zip(stats, chunk.items()):
+                col_stats.update(col, detailed)
+    if stats is None:
+        stats = [_ColumnStats(str(c)) for c in pd.read_csv(p, nrows=0).columns]
+    return TableProfile(num_rows=num_rows, columns=[c.finish() for c in stats])
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _stat_value(v) -> Any:
+    """Convert a parquet statistic to a json serializable value."""
+    return v if isinstance(v, (bool, int, float)) else str(v)
+
+
+def profile_columnar(p: Path) -> TableProfile:
+    """
+    Profile a parquet or feather/arrow file from its metadata only
+    (schema, row counts and the column statistics stored in parquet row groups), without loading any data.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # per column: [min, max, null count] (None if unknown)
+    stats: dict[str, list] = {}
+    if p.suffix == ".parquet":
+        pf = pq.ParquetFile(p)
+        schema = pf.schema_arrow
+        num_rows = pf.metadata.num_rows
+        fmt = f"parquet, {pf.metadata.num_row_groups} row groups"
+        for i in range(pf.metadata.num_row_groups):
+            rg = pf.metadata.row_group(i)
+            for j in range(rg.num_columns):
+                col = rg.column(j)
+                st = col.statistics
+                name = col.path_in_schema
+                if st is None or name not in schema.names:
+                    stats[name] = [None, None, None]
+                    continue
+                agg = stats.setdefault(name, [None, None, 0])
+                if st.has_min_max and (i == 0 or agg[0] is not None):
+                    try:
+                        agg[0] = st.min if agg[0] is None else min(agg[0], st.min)
+                        agg[1] = st.max if agg[1] is None else max(agg[1], st.max)
+                    except TypeError:
+                        agg[0] = agg[1] = None
+                else:
+                    agg[0] = agg[1] = None
+                if st.has_null_count and agg[2] is not None:
+                    agg[2] += st.null_count
+                else:
+                    agg[2] = None
+    else:
+        # the record batches are memory mapped, so this only reads their headers
+        with pa.memory_map(str(p)) as source:
+            reader = pa.ipc.open_file(source)
+            schema = reader.schema
+            num_rows = 0
+            null_counts = [0] * len(schema)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                num_rows += batch.num_rows
+                for j, col in enumerate(batch.columns):
+                    null_counts[j] += col.null_count
+        fmt = "feather/arrow"
+        stats = {name: [None, None, n] for name, n in zip(schema.names, null_counts)}
+
+    columns = []
+    for field_ in schema:
+        col_min, col_max, nulls = stats.get(field_.name, [None, None, None])
+        columns.append(
+            ColumnProfile(
+                name=field_.name,
+                dtype=str(field_.type),
+                nan_count=nulls,
+                num_unique=None,
+                min=_stat_value(col_min) if col_min is not None else None,
+                max=_stat_value(col_max) if col_max is not None else None,
+            )
+        )
+    return TableProfile(num_rows=num_rows, columns=columns, format=fmt)
+
+
+def summarize_json(p: Path) -> FileSummary:
+    """Summarize a json file by a generated json schema."""
+    builder = SchemaBuilder()
+    with open(p) as f:
+        builder.add_object(json.load(f))
+    return FileSummary(kind="json", text=builder.to_json(indent=2))
+
+
+def summarize_metadata(p: Path) -> FileSummary:
+    """Summarize a file using only its metadata (and the header of csv files)."""
+    out = [f"has {humanize.naturalsize(p.stat().st_size)}."]
+    if p.suffix == ".csv":
+        with open(p, newline="") as f:
+            header = next(csv.reader(f), [])
+        out.append(f"The columns are: {_format_column_names(header)}")
+    out.append(
+        "(no detailed preview is available because it took too long to generate)"
+    )
+    return FileSummary(kind="note", text="\n".join(out))
+
+
+def summarize_file(p: Path, simple=False) -> FileSummary:
+    """Summarize a csv, json or columnar file (without column statistics of csv files if `simple`)."""
+    if p.suffix == ".csv":
+        return FileSummary(kind="table", table=profile_csv(p, detailed=not simple))
+    if p.suffix in columnar_files:
+        return FileSummary(kind="table", table=profile_columnar(p))
+    return summarize_json(p)
+
+
+# detail levels at which file summaries are rendered, tables use the levels above DETAIL_SIMPLE
+# to describe that many of their columns in detail
+DETAIL_OMITTED = -2  # the file is not mentioned
+DETAIL_MINIMAL = -1  # a single line (e.g. the shape of a table)
+DETAIL_SIMPLE = (
+    0  # the list of column names of tables, the complete summary of other files
+)
+
+
+def _format_column_names(cols: list[str], sel_cols=15) -> str:
+    res = ", ".join(cols[:sel_cols])
+    if len(cols) > sel_cols:
+        res += f"... and {len(cols) - sel_cols} more columns"
+    return res
+
+
+def describe_column(col: ColumnProfile) -> str | None:
+    """Describe a column in one line (None if there is nothing to say about it)."""
+    name = f"{col.name} ({col.dtype})"
+    if col.num_unique is None:
+        # columnar files, only the statistics stored in their metadata are known
+        parts = []
+        if col.min is not None:
+            parts.append(f"range: {_format_stat(col.min)} - {_format_stat(col.max)}")
+        if col.nan_count is not None:
+            parts.append(f"{col.nan_count} nan values")
+        return f"{name} has {', '.join(parts)}" if parts else name
+    if col.dtype == "bool":
+        v = col.true_frac or 0.0
+        return f"{name} is {v * 100:.2f}% True, {100 - v * 100:.2f}% False"
+    if col.num_unique < 10:
+        return f"{name} has {col.num_unique} unique values: {col.unique_values}"
+    if col.min is not None:
+        return f"{name} has range: {col.min:.2f} - {col.max:.2f}, {col.nan_count} nan values"
+    if col.dtype == "object":
+        return f"{name} has {col.num_unique} unique values. Some example values: {col.top_values}"
+    return None
+
+
+def _format_stat(v) -> str:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return f"{v:.2f}"
+    v = str(v)
+    return repr(v if len(v) <= 30 else v[:30] + "...")
+
+
+def max_detail(summary: FileSummary) -> int:
+    if summary.kind == "table":
+        return len(summary.table.columns)
+    if summary.kind == "note":
+        return DETAIL_MINIMAL
+    return DETAIL_SIMPLE
+
+
+def render_summary(
+    summary: FileSummary,
+    file_name: str,
+    detail: int,
+    same_as: str | None = None,
+    descriptions: list[str | None] | None = None,
+) -> str:
+    """
+    Render a file summary at the given level of detail.
+
+    Args:
+        summary (FileSummary): the summary of the file
+        file_name (str): the file name to use in the preview
+        detail (int): level of detail (see DETAIL_*), for tables the number of columns that are described in detail
+        same_as (str | None, optional): name of a table with the same columns, which is referenced at DETAIL_MINIMAL. Defaults to None.
+        descriptions (list[str | None] | None, optional): the (precomputed) `describe_column` of each column. Defaults to None.
+    """
+    if detail <= DETAIL_OMITTED:
+        return ""
+    if summary.kind == "note":
+        return f"-> {file_name} {summary.text}"
+    if summary.kind == "json":
+        if detail <= DETAIL_MINIMAL:
+            return f"-> {file_name} is a json file (schema omitted)."
+        return f"-> {file_name} has auto-generated json schema:\n{summary.text}"
+    if summary.kind == "text":
+        if detail <= DETAIL_MINIMAL:
+            return f"-> {file_name} (content omitted)."
+        return f"-> {file_name} has content:\n\n{summary.text}"
+
+    table = cast(TableProfile, summary.table)
+    fmt = f" ({table.format})" if table.format else ""
+    if detail <= DETAIL_MINIMAL and same_as is not None:
+        return f"-> {file_name} has {table.num_rows} rows and the same {len(table.columns)} columns as {same_as}{fmt}."
+    out = [
+        f"-> {file_name} has {table.num_rows} rows and {len(table.columns)} columns{fmt}."
+    ]
+    if detail <= DETAIL_MINIMAL:
+        return out[0]
+    if detail == DETAIL_SIMPLE:
+        out.append(
+            f"The columns are: {_format_column_names([c.name for c in table.columns])}"
+        )
+        return "\n".join(out)
+
+    if descriptions is None:
+        descriptions = [describe_column(c) for c in table.columns]
+    if detail >= len(table.columns):
+        out.append("Here is some information about the columns:")
+        detailed = set(range(len(table.columns)))
+    else:
+        # condense the columns with the longest descriptions (e.g. example values of text columns) first
+        by_cost = sorted(
+            range(len(table.columns)), key=lambda i: len(descriptions[i] or "")
+        )
+        detailed = set(by_cost[:detail])
+        out.append(f"Here is some information about {detail} of the columns:")
+    for i in sorted(detailed, key=lambda i: table.columns[i].name):
+        if descriptions[i] is not None:
+            out.append(descriptions[i])
+    if len(detailed) < len(table.columns):
+        others = [c.name for i, c in enumerate(table.columns) if i not in detailed]
+        out.append(
+            f"The other {len(others)} columns are: {_format_column_names(others)}"
+        )
+    return "\n".join(out)
+
+
+def _lower_detail(summary: FileSummary, detail: int, same_as: str | None) -> int:
+    if summary.kind == "table" and detail > DETAIL_SIMPLE:
+        # tables with the same columns as an earlier one are condensed to a reference right away
+        return DETAIL_MINIMAL if same_as is not None else detail // 2
+    return detail - 1
+
+
+# the main files of a task (described in more detail than other files of the same size)
+_KEY_FILE_WORDS = ("train", "test", "submission", "sample", "label", "target")
+
+
+def render_summaries(
+    summaries: list[tuple[str, FileSummary]], max_chars: int | None, simple=False
+) -> list[str]:
+    """
+    Render file summaries within a budget of `max_chars` characters (in total).
+    Starting from the most detailed rendering, the largest previews lose detail first (tables keep fewer
+    columns in detail, then only their column names, then only their shape), previews of key files
+    (e.g. train/test data) are condensed last and at the end the least important files are dropped.
+
+    Args:
+        summaries (list[tuple[str, FileSummary]]): file names and summaries
+        max_chars (int | None): the budget, None for no limit
+        simple (bool, optional): whether to start at DETAIL_SIMPLE (only list the columns of tables). Defaults to False.
+    """
+    # files with the same columns as an earlier table
+    same_as: list[str | None] = []
+    schemas: dict[tuple, str] = {}
+    for file_name, summary in summaries:
+        if summary.kind != "table":
+            same_as.append(None)
             continue
-        yield p
+        schema = tuple((c.name, c.dtype) for c in summary.table.columns)
+        same_as.append(schemas.get(schema))
+        schemas.setdefault(schema, file_name)
+
+    descriptions = [
+        [describe_column(c) for c in s.table.columns] if s.kind == "table" else None
+        for _, s in summaries
+    ]
+    details = [
+        min(max_detail(s), DETAIL_SIMPLE) if simple else max_detail(s)
+        for _, s in summaries
+    ]
+
+    def render(i: int) -> str:
+        file_name, summary = summaries[i]
+        return render_summary(
+            summary, file_name, details[i], same_as[i], descriptions[i]
+        )
+
+    rendered = [render(i) for i in range(len(summaries))]
+    total = sum(len(r) + 2 for r in rendered if r)
+    if max_chars is None or total <= max_chars:
+        return [r for r in rendered if r]
+
+    def priority(i: int) -> float:
+        file_name = summaries[i][0].lower()
+        weight = 4 if any(w in file_name for w in _KEY_FILE_WORDS) else 1
+        return -len(rendered[i]) / weight
+
+    heap = [(priority(i), i) for i in range(len(summaries))]
+    heapq.heapify(heap)
+    while total > max_chars and heap:
+        _, i = heapq.heappop(heap)
+        total -= len(rendered[i]) + 2 if rendered[i] else 0
+        details[i] = _lower_detail(summaries[i][1], details[i], same_as[i])
+        rendered[i] = render(i)
+        total += len(rendered[i]) + 2 if rendered[i] else 0
+        if details[i] > DETAIL_OMITTED:
+            heapq.heappush(heap, (priority(i), i))
+
+    out = [r for r in rendered if r]
+    num_omitted = sum(not r for r in rendered)
+    if num_omitted:
+        out.append(
+            f"({num_omitted} more files are not previewed, see the directory structure above)"
+        )
+    return out
 
 
 def preview_csv(p: Path, file_name: str, simple=True) -> str:
@@ -67,87 +811,183 @@ def preview_csv(p: Path, file_name: str, simple=True) -> str:
     Returns:
         str: the textual preview
     """
-    df = pd.read_csv(p)
+    summary = summarize_file(p, simple=simple)
+    return render_summary(
+        summary, file_name, DETAIL_SIMPLE if simple else max_detail(summary)
+    )
 
-    out = []
 
-    out.append(f"-> {file_name} has {df.shape[0]} rows and {df.shape[1]} columns.")
+def preview_json(p: Path, file_name: str):
+    """Generate a textual preview of a json file using a generated json schema"""
+    return render_summary(summarize_json(p), file_name, DETAIL_SIMPLE)
 
-    if simple:
-        cols = df.columns.tolist()
-        sel_cols = 15
-        cols_str = ", ".join(cols[:sel_cols])
-        res = f"The columns are: {cols_str}"
-        if len(cols) > sel_cols:
-            res += f"... and {len(cols) - sel_cols} more columns"
-        out.append(res)
-    else:
-        out.append("Here is some information about the columns:")
-        for col in sorted(df.columns):
-            dtype = df[col].dtype
-            name = f"{col} ({dtype})"
-
-            nan_count = df[col].isnull().sum()
-
-            if dtype == "bool":
-                v = df[col][df[col].notnull()].mean()
-                out.append(f"{name} is {v * 100:.2f}% True, {100 - v * 100:.2f}% False")
-            elif df[col].nunique() < 10:
-                out.append(
-                    f"{name} has {df[col].nunique()} unique values: {df[col].unique().tolist()}"
-                )
-            elif is_numeric_dtype(df[col]):
-                out.append(
-                    f"{name} has range: {df[col].min():.2f} - {df[col].max():.2f}, {nan_count} nan values"
-                )
-            elif dtype == "object":
-                out.append(
-                    f"{name} has {df[col].nunique()} unique values. Some example values: {df[col].value_counts().head(4).index.tolist()}"
-                )
 
-    return "\n".join(out)
+def preview_columnar(p: Path, file_name: str, simple=True) -> str:
+    """Generate a textual preview of a parquet or feather/arrow file from its metadata only."""
+    summary = summarize_file(p)
+    return render_summary(
+        summary, file_name, DETAIL_SIMPLE if simple else max_detail(summary)
+    )
 
 
-def preview_json(p: Path, file_name: str):
-    """Generate a textual preview of a json file using a generated json schema"""
-    builder = SchemaBuilder()
-    with open(p) as f:
-        builder.add_object(json.load(f))
-    return f"-> {file_name} has auto-generated json schema:\n" + builder.to_json(
-        indent=2
-    )
+def preview_metadata(p: Path, file_name: str) -> str:
+    """Generate a cheap preview of a file that only uses its metadata (and the header of csv files)."""
+    return render_summary(summarize_metadata(p), file_name, DETAIL_MINIMAL)
 
 
-def generate(base_path, include_file_details=True, simple=False):
+def _summarize_file_with_budget(
+    p: Path, simple: bool, time_budget: float | None
+) -> FileSummary | None:
+    """Summarize a file, returns None if this takes longer than `time_budget` seconds."""
+    # the time budget uses SIGALRM, which is only available in the main thread
+    if time_budget is None or threading.current_thread() is not threading.main_thread():
+        return summarize_file(p, simple)
+
+    def on_alarm(signum, frame):
+        raise TimeoutError
+
+    prev_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, time_budget)
+    try:
+        return summarize_file(p, simple)
+    except TimeoutError:
+        return None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, prev_handler)
+
+
+# files are only summarized on a process pool if the uncached ones have at least this many bytes in total
+# (the pool's processes import aide once, which takes a few seconds)
+PARALLEL_MIN_BYTES = 256 * 1024 * 1024
+
+
+def _process_pool_context():
+    """
+    Workers are forked from a fork server (forking the multi-threaded agent process itself isn't safe) that has already
+    imported this module (and not the `__main__` module), so they start right away instead of importing aide each.
+    The fork server is started once per process and shared by all pools.
+    """
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+def _summarize_files(
+    files: list[tuple[Path, str]],
+    simple: bool,
+    cache: PreviewCache | None,
+    max_workers: int | None,
+    file_time_budget: float | None,
+) -> list[FileSummary]:
+    """
+    Summarize csv, json and columnar files on a process pool (unless there's only one worker or file, or they are small,
+    see `PARALLEL_MIN_BYTES`), each with a time budget after which we fall back to a metadata-only summary.
+    The summaries are returned in the order of `files`.
+    """
+    summaries: list[FileSummary | None] = [None] * len(files)
+    key = "summary:simple" if simple else "summary"
+    todo = []
+    for i, (p, _) in enumerate(files):
+        if cache is not None and (cached := cache.get(p, key)) is not None:
+            summaries[i] = FileSummary.from_dict(cached)
+        else:
+            todo.append(i)
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(todo))
+    if (
+        max_workers > 1
+        and sum(files[i][0].stat().st_size for i in todo) < PARALLEL_MIN_BYTES
+    ):
+        # starting the pool would take longer than summarizing the files
+        max_workers = 1
+    if max_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=_process_pool_context()
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _summarize_file_with_budget, files[i][0], simple, file_time_budget
+                )
+                for i in todo
+            ]
+            results = [f.result() for f in futures]
+    else:
+        results = [
+            _summarize_file_with_budget(files[i][0], simple, file_time_budget)
+            for i in todo
+        ]
+
+    for i, summary in zip(todo, results):
+        p, name = files[i]
+        if summary is None:
+            logger.warning(
+                f"Preview of {name} exceeded the time budget of {file_time_budget}s"
+            )
+            summaries[i] = summarize_metadata(p)
+        else:
+            summaries[i] = summary
+            if cache is not None:
+                cache.put(p, key, summary.to_dict())
+
+    return cast(list[FileSummary], summaries)
+
+
+def generate(
+    base_path,
+    include_file_details=True,
+    simple=False,
+    cache_dir=None,
+    max_workers=None,
+    file_time_budget=120,
+    max_chars=6_000,
+):
     """
     Generate a textual preview of a directory, including an overview of the directory
-    structure and previews of individual files
+    structure and previews of individual files.
+    If `cache_dir` is given, the summaries of individual files are cached there (see `PreviewCache`).
+    csv, json and columnar (parquet, feather) files are summarized in parallel on `max_workers` processes (defaults to the number of CPUs),
+    files that take longer than `file_time_budget` seconds only get a metadata-only preview.
+    Each file is summarized once, the previews are then rendered at the level of detail that fits into `max_chars` characters.
     """
-    tree = f"```\n{file_tree(base_path)}```"
+    cache = PreviewCache(cache_dir) if cache_dir is not None else None
+    tree = f"```\n{file_tree(base_path, cache=cache)}```"
     out = [tree]
 
     if include_file_details:
-        for fn in _walk(base_path):
-            file_name = str(fn.relative_to(base_path))
-
-            if fn.suffix == ".csv":
-                out.append(preview_csv(fn, file_name, simple=simple))
-            elif fn.suffix == ".json":
-                out.append(preview_json(fn, file_name))
+        files = [(fn, str(fn.relative_to(base_path))) for fn in _walk(base_path)]
+        profiled_suffixes = {".csv", ".json"}
+        if _has_pyarrow():
+            profiled_suffixes |= columnar_files
+        profiled_files = [f for f in files if f[0].suffix in profiled_suffixes]
+        summaries = dict(
+            zip(
+                profiled_files,
+                _summarize_files(
+                    profiled_files, simple, cache, max_workers, file_time_budget
+                ),
+            )
+        )
+        file_summaries = []
+        for fn, file_name in files:
+            if (fn, file_name) in summaries:
+                file_summaries.append((file_name, summaries[(fn, file_name)]))
             elif fn.suffix in plaintext_files:
-                if get_file_len_size(fn)[0] < 30:
+                num_lines = _cached(
+                    cache, fn, "len_size", lambda: get_file_len_size(fn)
+                )[0]
+                if num_lines < 30:
                     with open(fn) as f:
                         content = f.read()
                         if fn.suffix in code_files:
                             content = f"```\n{content}\n```"
-                        out.append(f"-> {file_name} has content:\n\n{content}")
+                        file_summaries.append(
+                            (file_name, FileSummary(kind="text", text=content))
+                        )
+        budget = max_chars - len(tree) if max_chars is not None else None
+        out.extend(render_summaries(file_summaries, budget, simple=simple))
 
-    result = "\n\n".join(out)
-
-    # if the result is very long we generate a simpler version
-    if len(result) > 6_000 and not simple:
-        return generate(
-            base_path, include_file_details=include_file_details, simple=True
-        )
+    if cache is not None:
+        cache.save()
 
-    return result
+    return "\n\n".join(out)
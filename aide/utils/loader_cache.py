@@ -0,0 +1,248 @@
+"""
+Transparent cache for data loaders, installed in the interpreter's child process.
+Supports:
+- `pandas.read_csv`, `numpy.loadtxt` and `numpy.genfromtxt` calls on files within the input dir
+- results are stored as pickles (which return identical objects, incl. dtypes and index), keyed on
+  a hash of the complete file contents (so copies of the data in other workspaces share the cache) and the call arguments
+- the on-disk cache is limited in size, the least recently used results are evicted
+- calls with arguments that can't be keyed (e.g. callables, buffers, chunked reading) are not cached
+- warm kernels additionally keep the results in memory (up to a size limit), each call returns a copy
+"""
+
+import copy
+import functools
+import hashlib
+import importlib
+import inspect
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+# (module, function name, name of the path argument)
+CACHED_LOADERS = [
+    ("pandas", "read_csv", "filepath_or_buffer"),
+    ("numpy", "loadtxt", "fname"),
+    ("numpy", "genfromtxt", "fname"),
+]
+
+# bump to invalidate all cached results
+LOADER_CACHE_VERSION = 1
+
+
+def _is_plain(v: Any) -> bool:
+    """Whether `v` has a stable repr that identifies it (so it can be part of a cache key)."""
+    if v is None or isinstance(v, (str, int, float, bool, type)):
+        return True
+    if isinstance(v, (list, tuple, set, frozenset)):
+        return all(_is_plain(x) for x in v)
+    if isinstance(v, dict):
+        return all(_is_plain(k) and _is_plain(x) for k, x in v.items())
+    return isinstance(v, np.dtype)
+
+
+def _cache_key(
+    name: str,
+    path_arg: str,
+    signature: inspect.Signature,
+    input_dirs: tuple[str, ...],
+    args,
+    kwargs,
+) -> str | None:
+    """Cache key of a loader call, None if the call should not be cached."""
+    try:
+        bound = signature.bind(*args, **kwargs)
+    except TypeError:
+        return None
+    arguments = dict(bound.arguments)
+    path = arguments.pop(path_arg, None)
+    if not isinstance(path, (str, os.PathLike)):
+        return None
+    # chunked reading returns an iterator instead of the data
+    if arguments.get("chunksize") is not None or arguments.get("iterator"):
+        return None
+    if not all(_is_plain(v) for v in arguments.values()):
+        return None
+
+    # the input files may be symlinks to the original data (if it isn't copied), so the unresolved path is checked too
+    real_path = os.path.realpath(os.fspath(path))
+    abs_path = os.path.abspath(os.fspath(path))
+    if not any(
+        p.startswith(d + os.sep) for p in (abs_path, real_path) for d in input_dirs
+    ):
+        return None
+    try:
+        fp = _fingerprint(real_path)
+    except OSError:
+        return None
+    # the file name matters as well (e.g. the compression is inferred from its suffix)
+    key = repr(
+        (
+            LOADER_CACHE_VERSION,
+            name,
+            os.path.basename(real_path),
+            fp,
+            sorted(arguments.items()),
+        )
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# directory where the content hashes of the input files are kept (None: only in memory)
+_hash_cache_dir: Path | None = None
+
+
+def _fingerprint(path: str) -> str:
+    from .data_preview import content_hash
+
+    # a full hash (not a sampled fingerprint), since a cached result must be identical to loading the file
+    return content_hash(Path(path), _hash_cache_dir)
+
+
+# in-memory results of this process (for warm kernels, which run several executions): key -> (result, size)
+_memo: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+_memo_max_bytes = 0
+
+
+def _nbytes(obj: Any) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True).sum())
+    return int(getattr(obj, "nbytes", 0))
+
+
+def _memoize(key: str, result: Any) -> None:
+    size = _nbytes(result)
+    if size > _memo_max_bytes:
+        return
+    _memo[key] = (copy.deepcopy(result), size)
+    # evict the least recently used results
+    while sum(size for _, size in _memo.values()) > _memo_max_bytes:
+        _memo.popitem(last=False)
+
+
+def _evict(cache_dir: Path, max_bytes: int) -> None:
+    """Delete the least recently used results (by mtime, which is updated on every hit) until the cache fits into `max_bytes`."""
+    entries = []
+    for f in cache_dir.glob("*.pkl"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            # evicted by another process
+            continue
+        entries.append((st.st_mtime, st.st_size, f))
+    total = sum(size for _, size, _ in entries)
+    for _, size, f in sorted(entries):
+        if total <= max_bytes:
+            break
+        f.unlink(missing_ok=True)
+        total -= size
+
+
+def _load_pickle(cache_f: Path) -> Any | None:
+    try:
+        with open(cache_f, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # e.g. a corrupted file (or one from an incompatible library version), it's overwritten later
+        pass
+    return None
+
+
+def _cached_loader(
+    loader: Callable,
+    name: str,
+    path_arg: str,
+    input_dirs: tuple[str, ...],
+    cache_dir: Path | None,
+    max_bytes: int,
+) -> Callable:
+    signature = inspect.signature(loader)
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        key = _cache_key(name, path_arg, signature, input_dirs, args, kwargs)
+        if key is None:
+            return loader(*args, **kwargs)
+
+        if key in _memo:
+            _memo.move_to_end(key)
+            # a copy, so changes made by the executed code don't affect later executions
+            return copy.deepcopy(_memo[key][0])
+
+        cache_f = cache_dir / f"{key}.pkl" if cache_dir is not None else None
+        result = _load_pickle(cache_f) if cache_f is not None else None
+        if result is not None:
+            try:
+                # mark the result as recently used
+                os.utime(cache_f)  # type: ignore
+            except OSError:
+                pass
+        else:
+            result = loader(*args, **kwargs)
+            if cache_f is not None:
+                tmp_f = cache_f.with_name(f"{cache_f.name}.{os.getpid()}.tmp")
+                try:
+                    with open(tmp_f, "wb") as f:
+                        pickle.dump(result, f, protocol=5)
+                    os.replace(tmp_f, cache_f)
+                    _evict(cache_dir, max_bytes)  # type: ignore
+                except Exception:
+                    tmp_f.unlink(missing_ok=True)
+        if _memo_max_bytes:
+            _memoize(key, result)
+        return result
+
+    wrapper.__aide_loader_cache__ = True  # type: ignore
+    return wrapper
+
+
+def install(
+    input_dir: Path | str,
+    cache_dir: Path | str | None = None,
+    memo_max_bytes: int = 0,
+    max_bytes: int = 10 * 1024**3,
+) -> None:
+    """
+    Patch the data loaders, so that loading files within `input_dir` is served from a cache.
+
+    Args:
+        input_dir (Path | str): only calls on files within this dir are cached
+        cache_dir (Path | str | None, optional): Directory of the on-disk cache, None to disable it. Defaults to None.
+        memo_max_bytes (int, optional): Also keep up to this many bytes of results in memory (for processes that run several executions). Defaults to 0.
+        max_bytes (int, optional): Size limit of the on-disk cache. Defaults to 10 GB.
+    """
+    global _memo_max_bytes, _hash_cache_dir
+
+    _memo_max_bytes = memo_max_bytes
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        _hash_cache_dir = cache_dir / "hashes"
+    # the input dir itself may be a symlink (e.g. in the workspaces of parallel workers)
+    input_dirs = (os.path.abspath(input_dir), os.path.realpath(input_dir))
+    for module_name, name, path_arg in CACHED_LOADERS:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        loader = getattr(module, name)
+        if getattr(loader, "__aide_loader_cache__", False):
+            continue
+        setattr(
+            module,
+            name,
+            _cached_loader(
+                loader,
+                f"{module_name}.{name}",
+                path_arg,
+                input_dirs,
+                cache_dir,
+                max_bytes,
+            ),
+        )
@@ -0,0 +1,157 @@
+"""
+Sampling profiler for the code executed in the interpreter's child process.
+Supports:
+- a background thread samples the stack of the main thread at a fixed interval (low overhead, no tracing hooks),
+  each sample is weighted by the time since the previous one (samples are delayed while native code holds the GIL)
+- records the share of the runtime spent in each line of the executed code and in each function (cumulative, incl. callees)
+- works for executions that are interrupted (timeouts, CPU time limits), the samples until then are kept
+- compact profiles that are attached to the node, shown to the agent and in the tree visualization
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+
+from dataclasses_json import DataClassJsonMixin
+
+
+@dataclass
+class ProfileEntry(DataClassJsonMixin):
+    # e.g. "line 42" (executed code) or "pandas/core/frame.py:DataFrame.apply" (functions)
+    location: str
+    # source of the line (for lines of the executed code)
+    source: str | None
+    # share of the runtime in which the line/function was on the stack
+    fraction: float
+
+
+@dataclass
+class ExecutionProfile(DataClassJsonMixin):
+    """Hot spots of an execution, by cumulative share of its runtime."""
+
+    num_samples: int
+    # seconds covered by the samples
+    duration: float
+    lines: list[ProfileEntry] = field(default_factory=list)
+    functions: list[ProfileEntry] = field(default_factory=list)
+
+    def describe(self) -> str:
+        out = [
+            f"Sampled {self.num_samples} times over {self.duration:.1f}s (share of the runtime incl. everything called from there):"
+        ]
+        if self.lines:
+            out.append("Lines of the code:")
+            for e in self.lines:
+                out.append(f"  {e.fraction:6.1%}  {e.location}: {e.source}")
+        if self.functions:
+            out.append("Functions:")
+            for e in self.functions:
+                out.append(f"  {e.fraction:6.1%}  {e.location}")
+        return "\n".join(out)
+
+
+def _short_path(path: str) -> str:
+    """Path of a module relative to its site-packages (or stdlib) dir."""
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        idx = path.rfind(marker)
+        if idx >= 0:
+            return path[idx + len(marker) :]
+    stdlib_dir = os.path.dirname(os.__file__) + os.sep
+    if path.startswith(stdlib_dir):
+        return path[len(stdlib_dir) :]
+    return os.path.basename(path)
+
+
+class SamplingProfiler:
+    def __init__(self, file_name: str, interval: float = 0.01, top_n: int = 10):
+        """
+        Samples the stack of the calling thread in a background thread, until `stop` is called.
+
+        Args:
+            file_name (str): file name of the executed code (its lines are profiled individually)
+            interval (float, optional): Seconds between samples. Defaults to 0.01.
+            top_n (int, optional): Number of lines and functions kept in the profile. Defaults to 10.
+        """
+        self.file_name = file_name
+        self.interval = interval
+        self.top_n = top_n
+        self.num_samples = 0
+        # seconds attributed to each line/function
+        self.line_times: Counter[int] = Counter()
+        self.function_times: Counter[tuple[str, str]] = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._start_time = self._last_sample_time = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            now = time.monotonic()
+            if frame is not None:
+                self._sample(frame, now - self._last_sample_time)
+            self._last_sample_time = now
+
+    def _sample(self, frame: FrameType | None, weight: float) -> None:
+        # each line/function is counted once per sample (e.g. for recursive calls)
+        lines: set[int] = set()
+        functions: set[tuple[str, str]] = set()
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == self.file_name:
+                lines.add(frame.f_lineno)
+                if code.co_name == "<module>":
+                    # the top of the executed code (the rest of the stack is the interpreter's)
+                    break
+            # co_qualname was added in Python 3.11
+            functions.add(
+                (code.co_filename, getattr(code, "co_qualname", code.co_name))
+            )
+            frame = frame.f_back
+        else:
+            # not within the executed code (e.g. in a thread's shutdown)
+            return
+        self.num_samples += 1
+        for lineno in lines:
+            self.line_times[lineno] += weight
+        for function in functions:
+            self.function_times[function] += weight
+
+    def stop(self, source: str) -> ExecutionProfile:
+        """Stop sampling and return the profile (`source` is the executed code)."""
+        self._stop.set()
+        self._thread.join()
+        duration = time.monotonic() - self._start_time
+        total = max(duration, 1e-9)
+        source_lines = source.splitlines()
+        lines = [
+            ProfileEntry(
+                location=f"line {lineno}",
+                source=(
+                    source_lines[lineno - 1].strip()
+                    if 0 < lineno <= len(source_lines)
+                    else None
+                ),
+                fraction=min(t / total, 1.0),
+            )
+            for lineno, t in self.line_times.most_common(self.top_n)
+        ]
+        functions = [
+            ProfileEntry(
+                location=f"{_short_path(path)}:{name}",
+                source=None,
+                fraction=min(t / total, 1.0),
+            )
+            for (path, name), t in self.function_times.most_common(self.top_n)
+        ]
+        return ExecutionProfile(
+            num_samples=self.num_samples,
+            duration=duration,
+            lines=lines,
+            functions=functions,
+        )
@@ -1,10 +1,12 @@
 import copy
+import dataclasses
 import json
+import os
 from pathlib import Path
 from typing import Type, TypeVar
 
 import dataclasses_json
-from ..journal import Journal
+from ..journal import Journal, Node
 
 
 def dumps_json(obj: dataclasses_json.DataClassJsonMixin):
@@ -43,9 +45,66 @@ def loads_json(s: str, cls: Type[G]) -> G:
         for child_id, parent_id in obj_dict["node2parent"].items():
             id2nodes[child_id].parent = id2nodes[parent_id]
             id2nodes[child_id].__post_init__()
+        obj.rebuild_index()
     return obj
 
 
 def load_json(path: Path, cls: Type[G]) -> G:
     with open(path, "r") as f:
         return loads_json(f.read(), cls)
+
+
+def dumps_node_record(node: Node) -> str:
+    """Serialize a single node (with a reference to its parent instead of the subtree) to one line of JSON."""
+    # detach the node from the tree, otherwise the parent/children would be serialized recursively
+    detached = dataclasses.replace(node, parent=None, children=set())
+    record = {
+        "node": detached.to_dict(),
+        "parent": node.parent.id if node.parent is not None else None,
+    }
+    return json.dumps(record, separators=(",", ":"))
+
+
+def append_journal_log(journal: Journal, path: Path) -> int:
+    """
+    Append all nodes that were added to the journal since the last call to an append-only
+    journal log (one JSON record per line), returns the number of appended records.
+    The cost only depends on the number of new nodes, not on the size of the journal.
+    """
+    lines = [dumps_node_record(n) + "\n" for n in journal.pop_unsaved()]
+    if lines:
+        with open(path, "a") as f:
+            f.writelines(lines)
+    return len(lines)
+
+
+def compact_journal_log(journal: Journal, path: Path) -> None:
+    """Rewrite the journal log with exactly one record per node (atomically)."""
+    with journal.lock:
+        journal.pop_unsaved()
+        lines = [dumps_node_record(n) + "\n" for n in journal.nodes]
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+def load_journal_log(path: Path) -> Journal:
+    """Rebuild a journal (including the tree structure) from a journal log, later records of a node replace earlier ones."""
+    records: dict[str, dict] = {}
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            # dicts preserve the insertion order, i.e. the order in which the nodes were appended
+            records[record["node"]["id"]] = record
+
+    journal = Journal(nodes=[Node.from_dict(r["node"]) for r in records.values()])
+    id2nodes = {n.id: n for n in journal.nodes}
+    for node_id, record in records.items():
+        if record["parent"] is not None:
+            id2nodes[node_id].parent = id2nodes[record["parent"]]
+            id2nodes[node_id].__post_init__()
+    journal.rebuild_index()
+    return journal
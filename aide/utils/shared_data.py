@@ -0,0 +1,130 @@
+"""
+Shared-memory data plane for the interpreter's children.
+Supports:
+- input tables (csv or parquet files) are converted once into a column store of .npy files
+  (string columns as categorical codes), shared by all experiments and keyed on a hash of the complete file contents
+- children memory map the columns, so all of them share a single physical copy of the data (in the page cache)
+- `load_table` (importable as `aide_data.load_table` in the generated code) returns a read-only DataFrame
+  backed by these memory maps without copying any data
+"""
+
+import fcntl
+import json
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .data_preview import content_hash
+
+logger = logging.getLogger("aide")
+
+# name under which the generated code can import this module
+MODULE_ALIAS = "aide_data"
+
+# bump to invalidate all stored tables
+SHARED_DATA_VERSION = 2
+
+# table name -> directory of its column store (configured in the child)
+_tables: dict[str, str] = {}
+
+
+def _write_table(df: pd.DataFrame, out_dir: Path) -> None:
+    columns = []
+    for i, (name, col) in enumerate(df.items()):
+        values = col.to_numpy()
+        if values.dtype == object:
+            # strings (or other python objects) can't be memory mapped, but their categorical codes can
+            cat = pd.Categorical(col)
+            np.save(out_dir / f"{i}.npy", cat.codes)
+            with open(out_dir / f"{i}.categories.pkl", "wb") as f:
+                pickle.dump(cat.categories, f, protocol=5)
+            kind = "category"
+        else:
+            np.save(out_dir / f"{i}.npy", values)
+            kind = "array"
+        columns.append({"name": name, "kind": kind})
+    with open(out_dir / "meta.json", "w") as f:
+        json.dump({"num_rows": len(df), "columns": columns}, f)
+
+
+def build_table(p: Path, store_dir: Path) -> Path:
+    """
+    Convert an input table (csv or parquet file) into a column store in `store_dir/<content hash>`
+    (unless it was already converted), returns its directory.
+    """
+    # a full hash (not a sampled fingerprint), since the stored table must match the file exactly
+    fp = content_hash(p, store_dir / "hashes")
+    table_dir = store_dir / f"{fp}-{SHARED_DATA_VERSION}-{p.name}"
+    if table_dir.exists():
+        return table_dir
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    with open(store_dir / f"{table_dir.name}.lock", "w") as lock_f:
+        # other interpreters (or experiments) may be converting the same table
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        if table_dir.exists():
+            return table_dir
+        logger.info(f"Loading {p.name} into the shared data store")
+        tmp_dir = store_dir / f"{table_dir.name}.__tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+        df = pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
+        _write_table(df, tmp_dir)
+        os.rename(tmp_dir, table_dir)
+    return table_dir
+
+
+def build_tables(input_dir: Path, names: list[str], store_dir: Path) -> dict[str, str]:
+    """Build the column stores of the tables `names` (paths relative to `input_dir`), returns name -> directory."""
+    tables = {}
+    for name in names:
+        p = input_dir / name
+        if not p.is_file():
+            logger.warning(f"Shared table {name} doesn't exist in {input_dir}")
+            continue
+        tables[name] = str(build_table(p, store_dir))
+    return tables
+
+
+def configure(tables: dict[str, str]) -> None:
+    """Make the tables available to `load_table` (called in the child)."""
+    import sys
+
+    _tables.update(tables)
+    sys.modules[MODULE_ALIAS] = sys.modules[__name__]
+
+
+def available_tables() -> list[str]:
+    return sorted(_tables)
+
+
+def load_table(name: str) -> pd.DataFrame:
+    """
+    Return the input table `name` (e.g. "train.csv") as a read-only DataFrame that shares its memory
+    with all other processes (string columns are categoricals). Use `.copy()` to get a writable DataFrame.
+    """
+    if name not in _tables:
+        raise KeyError(
+            f"{name} is not a shared table, available tables: {available_tables()}"
+        )
+    table_dir = Path(_tables[name])
+    with open(table_dir / "meta.json") as f:
+        meta = json.load(f)
+    data = {}
+    for i, col in enumerate(meta["columns"]):
+        values = np.load(table_dir / f"{i}.npy", mmap_mode="r")
+        if col["kind"] == "category":
+            with open(table_dir / f"{i}.categories.pkl", "rb") as f:
+                categories = pickle.load(f)
+            values = pd.Categorical.from_codes(values, categories=categories)
+        data[i] = values
+    # the columns are keyed by position first, since column names may not be unique
+    df = pd.DataFrame(data, copy=False)
+    df.columns = [col["name"] for col in meta["columns"]]
+    return df
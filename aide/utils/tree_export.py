@@ -12,7 +12,9 @@ from ..journal import Journal
 def get_edges(journal: Journal):
     for node in journal:
         for c in node.children:
-            yield (node.step, c.step)
+            # children without a step are still being worked on (parallel search)
+            if c.step is not None:
+                yield (node.step, c.step)
 
 
 def generate_layout(n_nodes, edges, layout_type="rt"):
@@ -68,6 +70,11 @@ def cfg_to_tree_struct(cfg, jou: Journal):
         code=[strip_code_markers(n.code) for n in jou],
         term_out=[n.term_out for n in jou],
         analysis=[n.analysis for n in jou],
+        resource_usage=[
+            n.resource_usage.describe() if n.resource_usage is not None else ""
+            for n in jou
+        ],
+        profile=[n.profile.describe() if n.profile is not None else "" for n in jou],
         exp_name=cfg.exp_name,
         metrics=metrics.tolist(),
     )
@@ -9,7 +9,7 @@ const updateTargetDims = () => {
   return [windowWidth * (1 / 2), windowHeight];
 };
 
-const setCodeAndPlan = (code, plan) => {
+const setCodeAndPlan = (code, plan, resourceUsage, profile) => {
   const codeElm = document.getElementById("code");
   if (codeElm) {
     // codeElm.innerText = code;
@@ -21,6 +21,16 @@ const setCodeAndPlan = (code, plan) => {
     // planElm.innerText = plan.trim();
     planElm.innerHTML = hljs.highlight(plan, { language: "plaintext" }).value;
   }
+
+  const usageElm = document.getElementById("resource-usage");
+  if (usageElm) {
+    usageElm.innerText = resourceUsage ? `Resources: ${resourceUsage}` : "";
+  }
+
+  const profileElm = document.getElementById("profile");
+  if (profileElm) {
+    profileElm.innerText = profile ? `Profile: ${profile}` : "";
+  }
 };
 
 windowResized = () => {
@@ -130,6 +140,8 @@ class Node {
       setCodeAndPlan(
         treeStructData.code[this.treeInd],
         treeStructData.plan[this.treeInd],
+        treeStructData.resource_usage[this.treeInd],
+        treeStructData.profile[this.treeInd],
       );
       manualSelection = true;
     }
@@ -327,6 +339,8 @@ draw = () => {
     setCodeAndPlan(
       treeStructData.code[0],
       treeStructData.plan[0],
+      treeStructData.resource_usage[0],
+      treeStructData.profile[0],
     )
   }
 
@@ -342,6 +356,8 @@ draw = () => {
         setCodeAndPlan(
           treeStructData.code[largestNode.treeInd],
           treeStructData.plan[largestNode.treeInd],
+          treeStructData.resource_usage[largestNode.treeInd],
+          treeStructData.profile[largestNode.treeInd],
         );
       }
       staticNodes.forEach((node) => {
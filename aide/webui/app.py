@@ -290,32 +290,37 @@ class WebUI:
             config_placeholder = results_col.empty()
             results_placeholder = results_col.empty()
 
-            for step in range(num_steps):
-                st.session_state.current_step = step + 1
-                progress = (step + 1) / num_steps
-
-                # Update progress
-                with progress_placeholder.container():
-                    st.markdown(
-                        f"### 🔥 Running Step {st.session_state.current_step}/{st.session_state.total_steps}"
-                    )
-                    st.progress(progress)
-
-                # Show config only for first step
-                if step == 0:
-                    with config_placeholder.container():
-                        st.markdown("### 📋 Configuration")
-                        st.code(OmegaConf.to_yaml(experiment.cfg), language="yaml")
-
-                experiment.run(steps=1)
-
-                # Show results
-                with results_placeholder.container():
-                    self.render_live_results(experiment)
-
-                # Clear config after first step
-                if step == 0:
-                    config_placeholder.empty()
+            try:
+                for step in range(num_steps):
+                    st.session_state.current_step = step + 1
+                    progress = (step + 1) / num_steps
+
+                    # Update progress
+                    with progress_placeholder.container():
+                        st.markdown(
+                            f"### 🔥 Running Step {st.session_state.current_step}/{st.session_state.total_steps}"
+                        )
+                        st.progress(progress)
+
+                    # Show config only for first step
+                    if step == 0:
+                        with config_placeholder.container():
+                            st.markdown("### 📋 Configuration")
+                            st.code(OmegaConf.to_yaml(experiment.cfg), language="yaml")
+
+                    # the final logs are only written once, after the last step
+                    experiment.run(steps=1, finalize=False)
+
+                    # Show results
+                    with results_placeholder.container():
+                        self.render_live_results(experiment)
+
+                    # Clear config after first step
+                    if step == 0:
+                        config_placeholder.empty()
+            finally:
+                # also on errors, so that the journal of the run is kept
+                experiment.finalize()
 
             # Clear progress after all steps
             progress_placeholder.empty()
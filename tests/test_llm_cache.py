@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from aide import backend
+from aide.backend import cache
+from aide.backend.utils import FunctionSpec
+
+review_spec = FunctionSpec(
+    name="submit_review",
+    json_schema={"type": "object", "properties": {"is_bug": {"type": "boolean"}}},
+    description="Submit a review",
+)
+
+
+def run_agent_queries(seed: int) -> list:
+    """The LLM requests of a small run, whose prompts differ between runs (like the agent's)."""
+    rng = random.Random(seed)
+    outputs = []
+    for step in range(3):
+        pkgs = ["numpy", "pandas", "torch", "lightgbm"]
+        rng.shuffle(pkgs)
+        outputs.append(
+            backend.query(
+                system_message={"Installed Packages": ", ".join(pkgs)},
+                user_message=None,
+                model="gpt-4.1",
+                temperature=0.5,
+            )
+        )
+        outputs.append(
+            backend.query(
+                system_message={"Execution output": f"Execution time: {rng.random()}s"},
+                user_message=None,
+                model="gpt-4.1-mini",
+                temperature=0.5,
+                func_spec=review_spec,
+            )
+        )
+    return outputs
+
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    calls = []
+
+    def query_func(system_message, user_message, func_spec=None, **model_kwargs):
+        calls.append(system_message)
+        if func_spec is not None:
+            return {"is_bug": len(calls) % 2 == 0}, 0.0, 0, 0, {}
+        return f"completion {len(calls)}", 0.0, 0, 0, {}
+
+    monkeypatch.setitem(backend.provider_to_query_func, "openai", query_func)
+    yield calls
+    monkeypatch.setattr(cache, "_cache", None)
+
+
+def test_replay_recorded_run(tmp_path, fake_provider):
+    cache.configure(tmp_path / "llm_cache.sqlite")
+    recorded = run_agent_queries(seed=0)
+    assert len(fake_provider) == 6
+
+    # a replay (in a new process) has different prompts, but gets the recorded responses in order
+    cache.configure(tmp_path / "llm_cache.sqlite", replay=True)
+    replayed = run_agent_queries(seed=1)
+    assert replayed == recorded
+    assert len(fake_provider) == 6
+
+    # there are no more recorded responses
+    with pytest.raises(cache.CacheMissError):
+        run_agent_queries(seed=2)
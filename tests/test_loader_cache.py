@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aide.utils import loader_cache
+
+
+@pytest.fixture
+def restore_loaders(monkeypatch):
+    # `install` patches the loaders of the whole process
+    monkeypatch.setattr(pd, "read_csv", pd.read_csv)
+    monkeypatch.setattr(np, "loadtxt", np.loadtxt)
+    monkeypatch.setattr(np, "genfromtxt", np.genfromtxt)
+
+
+def test_symlinked_input_files_are_cached(tmp_path, restore_loaders):
+    # without `copy_data`, the files in the input dir are symlinks to the original data
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}).to_csv(
+        data_dir / "train.csv", index=False
+    )
+    input_dir = tmp_path / "workspace" / "input"
+    input_dir.mkdir(parents=True)
+    (input_dir / "train.csv").symlink_to(data_dir / "train.csv")
+    cache_dir = tmp_path / "cache"
+
+    loader_cache.install(input_dir, cache_dir)
+    df = pd.read_csv(input_dir / "train.csv")
+    assert len(list(cache_dir.glob("*.pkl"))) == 1
+    pd.testing.assert_frame_equal(pd.read_csv(input_dir / "train.csv"), df)
+
+    # files outside of the input dir are not cached
+    pd.read_csv(data_dir / "train.csv")
+    assert len(list(cache_dir.glob("*.pkl"))) == 1